@@ -0,0 +1,60 @@
+"""
+Import cost of the package.
+
+Imports sdss (and optionally some of its names) in a fresh interpreter
+several times and reports the median wall time, the memory it adds and
+which heavy dependencies got loaded. With --max-ms the script exits with
+status 1 when the median exceeds the limit, so it can guard against
+regressions:
+
+    python benchmarks/import_time.py --max-ms 150
+    python benchmarks/import_time.py --stmt "from sdss import sql2df"
+"""
+
+import argparse, json, os, statistics, subprocess, sys
+
+HEAVY = ('numpy', 'pandas', 'matplotlib', 'PIL', 'requests', 'astropy')
+
+PROBE = """
+import json, resource, sys, time
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t = time.perf_counter()
+{stmt}
+ms = (time.perf_counter() - t) * 1000
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'ms':ms, 'rss_kb':after - before, 'loaded':heavy}}))
+"""
+
+
+def probe(stmt, root):
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    out = subprocess.run([sys.executable, '-c', PROBE.format(stmt=stmt, heavy=HEAVY)],
+                         capture_output=True, text=True, check=True, env=env)
+    return json.loads(out.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--stmt', default='import sdss', help='statement to time')
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters to use')
+    parser.add_argument('--max-ms', type=float, help='fail above this median time')
+    args = parser.parse_args(argv)
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    runs = [probe(args.stmt, root) for _ in range(args.runs)]
+    result = {'stmt':args.stmt,
+              'median_ms':statistics.median(r['ms'] for r in runs),
+              'min_ms':min(r['ms'] for r in runs),
+              'rss_kb':statistics.median(r['rss_kb'] for r in runs),
+              'loaded':runs[-1]['loaded']}
+    print(json.dumps(result, indent=2))
+    if args.max_ms is not None and result['median_ms'] > args.max_ms:
+        print(f"import time {result['median_ms']:.1f} ms exceeds {args.max_ms} ms",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Local stand-in for the SDSS services used by the package.
+
+Serves synthetic SqlSearch CSV, ImgCutout JPEGs, bz2 FITS frames, frame
+JPEGs and spectra (CSV and lite FITS) with configurable latency and
+throttling, so the package can be exercised without the network:
+
+    from mockserver import MockServer
+    with MockServer(latency=0.02, throttle_every=50) as srv:
+        set_transport(Transport(hosts=srv.hosts))
+        ...
+"""
+
+import bz2, io, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+import numpy as np
+from PIL import Image
+
+FRAME_SHAPE = (1489, 2048)
+BASE_OBJID = 1237646587710014999
+
+
+def _jpeg(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    b = io.BytesIO()
+    Image.fromarray(data).save(b, format='JPEG')
+    return b.getvalue()
+
+
+def _fits_frame(seed=0):
+    from astropy.io import fits
+    from astropy.wcs import WCS
+    rng = np.random.default_rng(seed)
+    h, w = FRAME_SHAPE
+    data = rng.normal(0.05, 0.01, (h, w)).astype(np.float32)
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN']
+    wcs.wcs.crval = [180.0, 0.0]
+    wcs.wcs.crpix = [w/2, h/2]
+    wcs.wcs.cd = [[0, 1.1e-4], [1.1e-4, 0]]
+    wcs.wcs.radesys = 'ICRS'
+    b = io.BytesIO()
+    fits.PrimaryHDU(data, header=wcs.to_header()).writeto(b)
+    return b.getvalue()
+
+
+def _fits_spectrum():
+    from astropy.io import fits
+    loglam = np.arange(3.5800, 4.0160, 1e-4)
+    cols = [fits.Column('flux', 'E', array=np.sin(loglam*50) + 2),
+            fits.Column('loglam', 'E', array=loglam),
+            fits.Column('ivar', 'E', array=np.ones_like(loglam)),
+            fits.Column('and_mask', 'J', array=np.zeros(len(loglam), dtype=np.int32))]
+    b = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns(cols)]).writeto(b)
+    return b.getvalue()
+
+
+def _columns(sql):
+    # output column names of a SELECT statement
+    m = re.search(r'SELECT\s+(?:TOP\s+\d+\s+)?(.*?)\s+FROM\s', sql, re.I | re.S)
+    cols = []
+    for part in m.group(1).split(','):
+        part = part.strip()
+        alias = re.search(r'\sAS\s+(\w+)$', part, re.I)
+        cols.append(alias.group(1) if alias else part.split('.')[-1])
+    return cols
+
+
+def sql_csv(sql, rows):
+    """Synthetic SqlSearch CSV answer of sql"""
+    top = re.search(r'TOP\s+(\d+)', sql, re.I)
+    if re.search(r'(objID|specObjID)\s*=\s*\d+', sql, re.I):
+        n = 1
+    elif re.search(r'\sIN\s*\(([^)]*)\)', sql, re.I):
+        n = len(re.search(r'\sIN\s*\(([^)]*)\)', sql, re.I).group(1).split(','))
+    else:
+        n = rows
+    if top:
+        n = min(n, int(top.group(1)))
+    cols = _columns(sql)
+    k = np.arange(n)
+    rng = np.random.default_rng(n)
+    out = {}
+    for c in cols:
+        lc = c.lower()
+        if lc in ('objid', 'bestobjid'):
+            out[c] = (BASE_OBJID + k).astype(str)
+        elif lc == 'specobjid':
+            out[c] = (299489677444933632 + (k << 10)).astype(str)
+        elif lc == 'type':
+            out[c] = np.full(n, '6')
+        elif lc == 'zwarning':
+            out[c] = np.zeros(n, dtype=int).astype(str)
+        elif lc == 'class':
+            out[c] = np.full(n, 'STAR')
+        elif lc == 'subclass':
+            out[c] = np.full(n, '"K5, III"')
+        elif lc == 'img':
+            out[c] = np.full(n, '0x' + _jpeg(16, 16).hex().upper())
+        elif lc == 'ra':
+            out[c] = np.char.mod('%.8f', 180 + rng.uniform(-0.05, 0.05, n))
+        elif lc == 'dec':
+            out[c] = np.char.mod('%.8f', rng.uniform(-0.05, 0.05, n))
+        elif lc == 'distance':
+            out[c] = np.char.mod('%.6f', np.sort(rng.uniform(0, 1, n)))
+        else:
+            out[c] = np.char.mod('%.5f', rng.uniform(14, 24, n))
+    lines = ['#Table1', ','.join(cols)]
+    lines += [','.join(row) for row in zip(*[out[c] for c in cols])]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class MockServer:
+    """
+    Arguments
+    ---------
+        latency : seconds added to every response
+        throttle_every : answer every n-th request with 429 (0: never)
+        retry_after : Retry-After of the throttled responses (seconds)
+        rows : rows returned by queries without TOP or ID conditions
+    """
+    def __init__(self, latency=0.0, throttle_every=0, retry_after=0.01, rows=500):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.rows = rows
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._server = None
+
+    def _blob(self, key, make):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = make()
+            return self._cache[key]
+
+    def respond(self, path, query):
+        """(status, content type, body) for a request"""
+        if path.endswith('/SqlSearch'):
+            return 200, 'text/plain', sql_csv(unquote(query['cmd'][0]), self.rows)
+        if path.endswith('/getjpeg'):
+            w, h = int(query['width'][0]), int(query['height'][0])
+            return 200, 'image/jpeg', self._blob(('cut', w, h), lambda: _jpeg(h, w))
+        if path.endswith('SpecById.ashx'):
+            return 200, 'image/jpeg', self._blob('specimg', lambda: _jpeg(400, 600))
+        if path.endswith('.fits.bz2'):
+            return 200, 'application/x-bzip2', self._blob('frame', lambda: bz2.compress(_fits_frame()))
+        if path.endswith('.jpg'):
+            h, w = FRAME_SHAPE
+            return 200, 'image/jpeg', self._blob('framejpg', lambda: _jpeg(h, w))
+        if path.endswith('.fits'):
+            return 200, 'application/fits', self._blob('spec', _fits_spectrum)
+        if 'format=csv' in path:
+            loglam = np.arange(3.58, 4.016, 1e-4)
+            body = 'Wavelength,Flux,BestFit,SkyFlux\n' + '\n'.join(
+                f'{10**l:.3f},{np.sin(l*50)+2:.4f},2.0,0.1' for l in loglam)
+            return 200, 'text/csv', self._blob('speccsv', lambda: body.encode())
+        return 404, 'text/plain', b'not found'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    throttle = server.throttle_every and server.requests % server.throttle_every == 0
+                    if throttle:
+                        server.throttled += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if throttle:
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(server.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                parts = urlsplit(self.path)
+                # the spectrum CSV service puts its parameters in the path
+                path = parts.path if 'format=csv' not in parts.path else self.path
+                status, ctype, body = server.respond(path, parse_qs(parts.query))
+                start = 0
+                rng = self.headers.get('Range')
+                if rng and status == 200:
+                    start = int(rng.split('=')[1].split('-')[0])
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body) - start))
+                self.end_headers()
+                self.wfile.write(body[start:])
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def hosts(self):
+        """Host mapping for sdss.transport.Transport"""
+        return {h:self.url for h in ('skyserver.sdss.org', 'data.sdss.org',
+                                     'dr16.sdss.org')}
@@ -0,0 +1,127 @@
+"""
+Offline benchmarks of the main entry points of the package.
+
+Runs against the local mock server (mockserver.py) and prints, or writes,
+a JSON document with throughput, latency percentiles and peak Python
+memory of each benchmark, tagged with the package version so results can
+be compared across versions:
+
+    python benchmarks/run.py --out results.json --latency 0.01 --throttle-every 50
+"""
+
+import argparse, json, os, platform, sys, tempfile, time, tracemalloc
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import matplotlib
+matplotlib.use('Agg')
+
+import sdss
+from sdss import photometry
+from sdss.transport import Transport, set_transport
+from sdss.scheduler import Scheduler, POLICIES
+from mockserver import MockServer, BASE_OBJID
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times; return timing and memory statistics"""
+    times = []
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    for k in range(repeat):
+        args = setup(k) if setup is not None else ()
+        t = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t)
+    total = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = np.array(times)
+    return {'calls':repeat,
+            'total_s':total,
+            'throughput_per_s':repeat / times.sum() if times.sum() else None,
+            'latency_ms':{f'p{q}':float(np.percentile(times, q) * 1000)
+                          for q in (50, 90, 99)},
+            'mean_ms':float(times.mean() * 1000),
+            'peak_mem_mb':peak / 1024**2}
+
+
+def benchmarks(workdir, n):
+    ids = BASE_OBJID + np.arange(100000, dtype=np.int64)
+    frame_url = photometry.obj_frame_url(BASE_OBJID, 'r')
+    zip_file = os.path.join(workdir, frame_url.rsplit('/', 1)[-1])
+    fits_file = zip_file[:-4]
+    photometry.download_file(frame_url, workdir + '/')
+    photometry.unzip(zip_file)
+    data = fits.getdata(fits_file)
+    df = photometry.get_df(BASE_OBJID)
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(0, data.shape[1], 2000)
+    ys = rng.uniform(0, data.shape[0], 2000)
+
+    return {
+        'decode_objid': (lambda: [sdss.decode_objid(int(i)) for i in ids[:1000]], n),
+        'decode_objids_100k': (lambda: sdss.decode_objids(ids), n),
+        'sql2df': (lambda: sdss.sql2df('SELECT TOP 1000 objID, ra, dec, u, g, r, i, z FROM PhotoObj'), n),
+        'PhotoObj.download': (lambda: sdss.PhotoObj(BASE_OBJID).download(), n),
+        'PhotoObj.download_many_1000': (lambda: sdss.PhotoObj.download_many(ids[:1000]), max(n//10, 1)),
+        'Region.nearest_objects': (lambda: sdss.Region(180.0, 0.0).nearest_objects(), n),
+        'get_df': (lambda: photometry.FrameCatalog().obj_df(BASE_OBJID), n),
+        'img_cutout': (lambda: sdss.img_cutout(180.0, 0.0, 0.4, 300, 300, '', ''), n),
+        'frame_download_unzip': (lambda: (photometry.download_file(frame_url, workdir + '/'),
+                                          photometry.unzip(zip_file)), max(n//10, 1)),
+        'fetch_file': (lambda: photometry.fetch_file(frame_url, workdir), max(n//10, 1)),
+        'df_radec2pixel': (lambda: photometry.df_radec2pixel(df.copy(), fits_file), n),
+        'flux': (lambda: photometry.flux(data, (1024.3, 700.7), 5), n),
+        'aperture_photometry_2000': (lambda: photometry.aperture_photometry(data, xs, ys, 5), max(n//10, 1)),
+        'SpecObj.spec_df': (lambda: sdss.SpecObj(299489677444933632).spec_df(), n),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', help='JSON output file (default: stdout)')
+    parser.add_argument('--repeat', type=int, default=20, help='calls per benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='server latency in seconds')
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='throttle every n-th request with 429')
+    parser.add_argument('--rows', type=int, default=500, help='rows per query')
+    parser.add_argument('--only', nargs='*', help='names of the benchmarks to run')
+    args = parser.parse_args(argv)
+
+    results = {}
+    with MockServer(latency=args.latency, throttle_every=args.throttle_every,
+                    rows=args.rows) as srv, tempfile.TemporaryDirectory() as workdir:
+        # the mock server has no rate limit: keep the adaptive concurrency only
+        policies = {name:{**p, 'rate':None} for name, p in POLICIES.items()}
+        set_transport(Transport(hosts=srv.hosts, backoff=0.01, scheduler=Scheduler(policies)))
+        for name, (func, repeat) in benchmarks(workdir, args.repeat).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(func, repeat)
+            print(f"{name:30s} {results[name]['mean_ms']:10.2f} ms", file=sys.stderr)
+        server = {'requests':srv.requests, 'throttled':srv.throttled}
+
+    doc = {'sdss_version':sdss.__version__,
+           'python':platform.python_version(),
+           'numpy':np.__version__,
+           'pandas':pd.__version__,
+           'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'settings':vars(args),
+           'server':server,
+           'results':results}
+    text = json.dumps(doc, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
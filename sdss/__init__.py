@@ -1,7 +1,32 @@
-from .objects import PhotoObj, SpecObj
-from .regions import Region
-from .refs import manga_ancillary
-from .utils import (decode_objid, decode_specid, sql2df, sql_columns, binimg2array,
-                    img_cutout, show_spect, show_object)
+# Public names are loaded on first access, so "import sdss" stays cheap
+# and heavy dependencies are only imported by the functions that need them.
+import importlib
+
+_lazy = {
+    'PhotoObj':'objects', 'SpecObj':'objects',
+    'PhotoObjCollection':'objects', 'SpecObjCollection':'objects',
+    'Region':'regions',
+    'manga_ancillary':'refs',
+    'enable_cache':'cache', 'disable_cache':'cache',
+    'decode_objid':'utils', 'decode_specid':'utils',
+    'decode_objids':'utils', 'decode_specids':'utils',
+    'encode_objids':'utils', 'encode_specids':'utils',
+    'sql2df':'utils', 'sql_columns':'utils', 'binimg2array':'utils',
+    'img_cutout':'utils', 'show_spect':'utils', 'show_object':'utils',
+}
+
+__all__ = list(_lazy)
 
 __version__ = "1.1.1"
+
+
+def __getattr__(name):
+    if name in _lazy:
+        value = getattr(importlib.import_module('.' + _lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
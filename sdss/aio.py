@@ -0,0 +1,75 @@
+"""
+aio module
+----------
+asyncio interface to the network functions of the package.
+
+Each coroutine runs the corresponding blocking function in a shared thread
+pool, bounded by a semaphore per endpoint, so many requests can be kept in
+flight from one event loop:
+
+    import asyncio
+    from sdss.aio import async_sql2df
+
+    async def main(scripts):
+        return await asyncio.gather(*[async_sql2df(s) for s in scripts])
+
+To have hundreds of requests in flight, raise the endpoint limit
+(set_limit), the connection pool of the transport (Transport(pool_maxsize=...))
+and the concurrency bounds of its scheduler (see sdss.scheduler).
+"""
+
+import asyncio, functools, threading, weakref
+from concurrent.futures import ThreadPoolExecutor
+from .utils import sql2df, img_cutout
+
+# maximum number of concurrent requests per endpoint
+limits = {'sql':10, 'cutout':10, 'spectrum':10, 'sas':10}
+
+_executor = None
+_executor_lock = threading.Lock()
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_limit(endpoint, n):
+    """
+    Set the maximum number of concurrent requests to endpoint.
+    The thread pool is sized from the limits when it is first used.
+    """
+    limits[endpoint] = n
+    for sems in _semaphores.values():
+        sems.pop(endpoint, None)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(32, sum(limits.values())),
+                                               thread_name_prefix='sdss-aio')
+    return _executor
+
+
+def _semaphore(endpoint):
+    loop = asyncio.get_running_loop()
+    sems = _semaphores.setdefault(loop, {})
+    if endpoint not in sems:
+        sems[endpoint] = asyncio.Semaphore(limits[endpoint])
+    return sems[endpoint]
+
+
+async def run_blocking(endpoint, func, *args, **kwargs):
+    """Run func(*args, **kwargs) in the thread pool within the endpoint limit"""
+    loop = asyncio.get_running_loop()
+    async with _semaphore(endpoint):
+        return await loop.run_in_executor(_get_executor(),
+                                          functools.partial(func, *args, **kwargs))
+
+
+async def async_sql2df(script, dtype=None, dr=16):
+    return await run_blocking('sql', sql2df, script, dtype=dtype, dr=dr)
+
+
+async def async_img_cutout(ra, dec, scale, width, height, opt, query):
+    return await run_blocking('cutout', img_cutout, ra, dec, scale=scale,
+                              width=width, height=height, opt=opt, query=query)
@@ -0,0 +1,165 @@
+"""
+cache module
+------------
+Opt-in on-disk cache for the results of sql2df.
+
+Results are stored column by column in .npz files, keyed by the normalized
+SQL script and the data release. The cache has a size limit (least recently
+used entries are evicted first) and an optional time-to-live per entry.
+Files are written atomically, so several processes can share one directory.
+
+    from sdss.cache import enable_cache
+    cache = enable_cache('~/.cache/sdss', max_size=2*1024**3, ttl=None)
+    ...
+    cache.stats()
+"""
+
+import hashlib, json, os, tempfile, time
+import numpy as np
+
+SUFFIX = '.npz'
+
+
+def normalize_sql(script):
+    """Collapse whitespace so equivalent scripts share a key"""
+    return ' '.join(script.split())
+
+
+class QueryCache:
+    """
+    Arguments
+    ---------
+        path : cache directory (created if needed)
+        max_size : maximum total size in bytes
+        ttl : maximum age of an entry in seconds (None: never expires)
+    """
+    def __init__(self, path, max_size=1024**3, ttl=None):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, script, dr):
+        text = f"dr{dr}:{normalize_sql(script)}"
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, script, dr):
+        """Return the cached DataFrame or None"""
+        import pandas as pd
+        filename = self._file(self.key(script, dr))
+        try:
+            with np.load(filename, allow_pickle=False) as npz:
+                meta = json.loads(str(npz['__meta__']))
+                if self.ttl is not None and time.time() - meta['created'] > self.ttl:
+                    df = None
+                else:
+                    data = {}
+                    for i, c in enumerate(meta['columns']):
+                        col = npz[f'c{i}']
+                        if f'm{i}' in npz.files:
+                            col = col.astype(object)
+                            col[npz[f'm{i}']] = None
+                        data[c] = col
+                    df = pd.DataFrame(data, columns=meta['columns'])
+        except (OSError, KeyError, ValueError):
+            df = None
+        if df is None:
+            self.misses += 1
+            return None
+        try:
+            os.utime(filename) # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return df
+
+    def put(self, script, dr, df):
+        """Store df as the result of script"""
+        meta = {'created':time.time(), 'dr':dr, 'sql':normalize_sql(script),
+                'columns':[str(c) for c in df.columns]}
+        arrays = {'__meta__':np.array(json.dumps(meta))}
+        for i, c in enumerate(df.columns):
+            col = df[c]
+            if col.dtype.kind in 'biuf':
+                arrays[f'c{i}'] = col.to_numpy()
+            else:
+                # text columns: fixed width strings plus a mask of nulls
+                isnull = col.isna().to_numpy()
+                arrays[f'c{i}'] = col.fillna('').to_numpy().astype(str)
+                if isnull.any():
+                    arrays[f'm{i}'] = isnull
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._file(self.key(script, dr)))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size"""
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        return {'hits':self.hits, 'misses':self.misses,
+                'evictions':self.evictions, 'entries':len(entries),
+                'size':sum(e[1] for e in entries)}
+
+
+_cache = None
+
+
+def enable_cache(path='~/.cache/sdss', max_size=1024**3, ttl=None):
+    """Turn on caching of sql2df results and return the cache"""
+    global _cache
+    _cache = QueryCache(path, max_size=max_size, ttl=ttl)
+    return _cache
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    """Return the active cache or None"""
+    return _cache
@@ -0,0 +1,298 @@
+"""
+cli module
+----------
+Command-line bulk downloads ("sdss" console script):
+
+    sdss fetch photo objids.txt -o photo       # PhotoObj rows -> part-NNNNN.parquet
+    sdss fetch spec specobjids.txt -o spectra  # spec-PLATE-MJD-FIBER.fits
+    sdss fetch frames objids.txt -o frames --bands gri
+    sdss fetch cutouts coords.txt -o cutouts --scale 0.2
+
+Input files have one ID (or "ra dec" pair for cutouts) per line; blank lines
+and lines starting with # are skipped, and "-" reads stdin. Tasks run in a
+bounded thread pool. Each completed task is appended to OUT/checkpoint.txt,
+so running the same command again skips the finished tasks; failed tasks
+are reported and retried by the next run.
+"""
+
+import argparse, hashlib, os, sys, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def read_lines(filename):
+    """Non-empty, non-comment lines of filename ('-' for stdin)"""
+    f = sys.stdin if filename == '-' else open(filename)
+    try:
+        lines = [line.strip() for line in f]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def read_ids(filename):
+    """IDs from the first column of each line"""
+    return [int(line.replace(',', ' ').split()[0]) for line in read_lines(filename)]
+
+
+def read_coords(filename):
+    """(ra, dec) pairs from the first two columns of each line"""
+    coords = []
+    for line in read_lines(filename):
+        ra, dec = line.replace(',', ' ').split()[:2]
+        coords.append((float(ra), float(dec)))
+    return coords
+
+
+def _read_raw(filename):
+    with open(filename) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+class Checkpoint:
+    """
+    Keys of completed tasks, one per line in a text file. The first line
+    identifies the job, so a directory is not resumed with other inputs.
+    """
+    def __init__(self, filename, job):
+        self.filename = filename
+        self.done = set()
+        header = f"# {job}"
+        if os.path.exists(filename):
+            lines = _read_raw(filename)
+            if lines and lines[0] != header:
+                raise Exception(f"{filename} belongs to another job; use another output directory.")
+            self.done = set(lines[1:])
+            self._f = open(filename, 'a')
+        else:
+            self._f = open(filename, 'w')
+            self._f.write(header + '\n')
+            self._f.flush()
+
+    def add(self, key):
+        self.done.add(key)
+        self._f.write(key + '\n')
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def job_id(kind, items, *options):
+    h = hashlib.sha1(repr(list(items)).encode())
+    return ' '.join([kind, *map(str, options), h.hexdigest()[:16]])
+
+
+class Progress:
+    """Throughput and ETA printed to stderr at most every interval seconds"""
+    def __init__(self, total, skipped=0, interval=1.0, stream=sys.stderr):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.interval = interval
+        self.stream = stream
+        self.t0 = time.perf_counter()
+        self._last = 0
+
+    def update(self, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+        now = time.perf_counter()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self.t0
+        n = self.done + self.failed
+        rate = n / elapsed if elapsed > 0 else 0
+        left = self.total - self.skipped - n
+        eta = time.strftime('%H:%M:%S', time.gmtime(left / rate)) if rate > 0 else '--:--:--'
+        end = '\r' if self.stream.isatty() else '\n'
+        self.stream.write(f"{self.skipped + self.done}/{self.total} done, {self.failed} failed, "
+                          f"{rate:.1f}/s, ETA {eta}  {end}")
+        self.stream.flush()
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.t0
+        if self.stream.isatty():
+            self.stream.write('\n')
+        self.stream.write(f"{self.done} done, {self.failed} failed, "
+                          f"{self.skipped} skipped in {elapsed:.1f} s\n")
+
+
+def run_tasks(tasks, func, checkpoint, workers=8, on_result=None, interval=1.0):
+    """
+    Run func(*args) for each (key, args) of tasks not yet in checkpoint,
+    with at most 2*workers tasks submitted at a time.
+
+    Returns the list of (key, exception) of the failed tasks.
+    """
+    todo = [(key, args) for key, args in tasks if key not in checkpoint.done]
+    progress = Progress(len(tasks), len(tasks) - len(todo), interval)
+    failed = []
+    it = iter(todo)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        running = {}
+
+        def submit():
+            for key, args in it:
+                running[ex.submit(func, *args)] = key
+                if len(running) >= 2 * workers:
+                    return
+
+        submit()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                key = running.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    failed.append((key, e))
+                    progress.update(failed=True)
+                    continue
+                if on_result is not None:
+                    on_result(key, result)
+                checkpoint.add(key)
+                progress.update()
+            submit()
+    progress.finish()
+    return failed
+
+
+def fetch_photo(args):
+    from .objects import PhotoObjCollection
+    from .utils import require_parquet
+    require_parquet()
+    ids = read_ids(args.input)
+    batches = [ids[k:k+args.batch] for k in range(0, len(ids), args.batch)]
+    tasks = [(f"part-{k:05d}", (k, batch)) for k, batch in enumerate(batches)]
+
+    def fetch(k, batch):
+        objs, missing = PhotoObjCollection.download(batch, dr=args.dr)
+        objs.to_DataFrame().to_parquet(os.path.join(args.out, f"part-{k:05d}.parquet"), index=False)
+        return missing
+
+    def on_result(key, missing):
+        if missing:
+            with open(os.path.join(args.out, 'missing.txt'), 'a') as f:
+                f.write(''.join(i + '\n' for i in missing))
+
+    return ('photo', ids, args.batch, args.dr), tasks, fetch, on_result
+
+
+def fetch_spec(args):
+    from .objects import SpecObj
+    ids = read_ids(args.input)
+    tasks = [(str(i), (i,)) for i in dict.fromkeys(ids)]
+
+    def fetch(i):
+        SpecObj(i).download_spec(path=args.out, lite=not args.full)
+
+    return ('spec', ids, args.full), tasks, fetch, None
+
+
+def fetch_frames(args):
+    from .utils import decode_objids
+    from .photometry import fetch_file, frame_url
+    ids = read_ids(args.input)
+    dc = decode_objids(ids)
+    fields = sorted(set(zip(dc['rerun'].tolist(), dc['run'].tolist(),
+                            dc['camcol'].tolist(), dc['field'].tolist())))
+    tasks = []
+    for rerun, run, camcol, field in fields:
+        for band in args.bands:
+            url = frame_url(run, camcol, field, band, rerun=rerun, dr=args.dr)
+            tasks.append((url.rsplit('/', 1)[-1], (url,)))
+        if args.jpg:
+            url = frame_url(run, camcol, field, 'irg', rerun=rerun, dr=args.dr, jpg=True)
+            tasks.append((url.rsplit('/', 1)[-1], (url,)))
+
+    def fetch(url):
+        fetch_file(url, args.out, decompress=False if args.keep_bz2 else None)
+
+    return ('frames', ids, args.bands, args.jpg, args.keep_bz2, args.dr), tasks, fetch, None
+
+
+def fetch_cutouts(args):
+    import numpy as np
+    from astropy.io import fits
+    from .utils import img_cutout
+    coords = read_coords(args.input)
+    tasks = [(f"cutout-{k:06d}", (k, ra, dec)) for k, (ra, dec) in enumerate(coords)]
+
+    def fetch(k, ra, dec):
+        data = img_cutout(ra=ra, dec=dec, scale=args.scale, width=args.width,
+                          height=args.height, opt=args.opt, query='')
+        # FITS images have the first row at the bottom
+        hdu = fits.PrimaryHDU(np.ascontiguousarray(np.moveaxis(data[::-1], -1, 0)))
+        hdu.header['RA'] = (ra, 'center right ascension (deg)')
+        hdu.header['DEC'] = (dec, 'center declination (deg)')
+        hdu.header['SCALE'] = (args.scale, 'arcsec per pixel')
+        hdu.writeto(os.path.join(args.out, f"cutout-{k:06d}.fits"), overwrite=True)
+
+    return ('cutouts', coords, args.scale, args.width, args.height, args.opt), tasks, fetch, None
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='sdss', description='Bulk downloads from SDSS.')
+    commands = p.add_subparsers(dest='command', required=True)
+    fetch = commands.add_parser('fetch', help='download objects, spectra, frames or cutouts')
+    kinds = fetch.add_subparsers(dest='kind', required=True)
+
+    def add(name, func, help, input_help):
+        k = kinds.add_parser(name, help=help)
+        k.add_argument('input', help=input_help + " ('-' for stdin)")
+        k.add_argument('-o', '--out', default='.', help='output directory')
+        k.add_argument('-w', '--workers', type=int, default=8, help='concurrent downloads')
+        k.add_argument('--interval', type=float, default=1.0, help='seconds between progress lines')
+        k.set_defaults(func=func)
+        return k
+
+    k = add('photo', fetch_photo, 'PhotoObj rows to Parquet', 'file of objIDs')
+    k.add_argument('--batch', type=int, default=200, help='objIDs per query and per part file')
+    k.add_argument('--dr', type=int, default=16, help='data release')
+    k = add('spec', fetch_spec, 'spectra to FITS', 'file of specObjIDs')
+    k.add_argument('--full', action='store_true', help='full spectra instead of lite')
+    k = add('frames', fetch_frames, 'frames of the fields of objects', 'file of objIDs')
+    k.add_argument('--bands', default='r', help='bands to download, e.g. ugriz')
+    k.add_argument('--jpg', action='store_true', help='also download the irg jpg')
+    k.add_argument('--keep-bz2', action='store_true', help='do not decompress the frames')
+    k.add_argument('--dr', type=int, default=17, help='data release')
+    k = add('cutouts', fetch_cutouts, 'cutout images to FITS', 'file of "ra dec" lines')
+    k.add_argument('--scale', type=float, default=0.4, help='arcsec per pixel')
+    k.add_argument('--width', type=int, default=300)
+    k.add_argument('--height', type=int, default=300)
+    k.add_argument('--opt', default='', help='SkyServer drawing options, e.g. GL')
+    return p
+
+
+def main(argv=None):
+    from .transport import Transport, get_transport, set_transport
+    args = parser().parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    job, tasks, func, on_result = args.func(args)
+    transport = get_transport()
+    if transport.pool_maxsize < args.workers:
+        # one connection per worker, keeping the other settings
+        set_transport(Transport(timeout=transport.timeout, retries=transport.retries,
+                                backoff=transport.backoff, max_backoff=transport.max_backoff,
+                                pool_maxsize=args.workers, hosts=transport.hosts,
+                                headers=transport.headers, scheduler=transport.scheduler))
+    checkpoint = Checkpoint(os.path.join(args.out, 'checkpoint.txt'), job_id(*job))
+    try:
+        failed = run_tasks(tasks, func, checkpoint, workers=args.workers,
+                           on_result=on_result, interval=args.interval)
+    finally:
+        checkpoint.close()
+    for key, e in failed[:20]:
+        print(f"failed {key}: {e}", file=sys.stderr)
+    if len(failed) > 20:
+        print(f"... and {len(failed) - 20} more", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
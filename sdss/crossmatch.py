@@ -0,0 +1,135 @@
+"""
+crossmatch module
+-----------------
+Positional cross-match of user catalogs against SDSS.
+
+Input positions are grouped into sky cells (see sdss.sky); the SDSS sources
+of each cell are fetched with a single cone search and matched locally.
+Cells are processed in parallel.
+
+    from sdss.crossmatch import crossmatch
+    matched = crossmatch(my_df, radius=2)   # arcsec, nearest match
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from .sky import angsep, cell_ids, cell_circle
+from .index import objects_script, spects_script, CELL_LIMIT, COLUMNS
+from .utils import sql2df
+
+
+def match_coords(ra1, dec1, ra2, dec2, radius, nearest=True):
+    """
+    Pairs of positions closer than radius (arcsec).
+
+    Catalog 2 is sorted by declination and each position of catalog 1 is
+    compared only with the declination window around it.
+
+    Returns
+    -------
+        i1, i2 : indices into catalog 1 and 2
+        sep : separations in arcsec
+        With nearest=True each index of catalog 1 appears at most once.
+    """
+    ra1, dec1 = np.asarray(ra1, dtype=float), np.asarray(dec1, dtype=float)
+    ra2, dec2 = np.asarray(ra2, dtype=float), np.asarray(dec2, dtype=float)
+    r = radius / 3600
+    order = np.argsort(dec2, kind='stable')
+    dec2s = dec2[order]
+    lo = np.searchsorted(dec2s, dec1 - r, side='left')
+    hi = np.searchsorted(dec2s, dec1 + r, side='right')
+    counts = hi - lo
+    i1 = np.repeat(np.arange(len(ra1)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    i2 = order[np.repeat(lo, counts) + np.arange(len(i1)) - first]
+    sep = angsep(ra1[i1], dec1[i1], ra2[i2], dec2[i2]) * 3600
+    keep = sep <= radius
+    i1, i2, sep = i1[keep], i2[keep], sep[keep]
+    s = np.lexsort((sep, i1))
+    i1, i2, sep = i1[s], i2[s], sep[s]
+    if nearest and len(i1):
+        first = np.r_[True, i1[1:] != i1[:-1]]
+        i1, i2, sep = i1[first], i2[first], sep[first]
+    return i1, i2, sep
+
+
+def _fetch_cell(cell, cell_size, radius, kind, dr):
+    cra, cdec, crad = cell_circle(cell, cell_size)
+    r = (crad + radius/3600) * 60 * 1.001
+    if kind == 'objects':
+        script = objects_script(cra, cdec, r, n_max=CELL_LIMIT)
+    else:
+        script = spects_script(cra, cdec, r, n_max=CELL_LIMIT)
+    df = sql2df(script, dr=dr)
+    if len(df) >= CELL_LIMIT:
+        raise Exception(f"Cell {cell} has too many sources; use a smaller cell_size.")
+    return df.drop(columns='distance')
+
+
+def _join(left, right, sep):
+    # rows of df side by side with their SDSS sources, with the index of left
+    index = left.index
+    left = left.reset_index(drop=True)
+    right = right.reset_index(drop=True)
+    right.columns = [c + '_sdss' if c in left.columns else c for c in right.columns]
+    out = pd.concat([left, right], axis=1)
+    out['sep'] = sep
+    out.index = index
+    return out
+
+
+def crossmatch(df, radius=1.0, ra_col='ra', dec_col='dec', kind='objects',
+               nearest=True, cell_size=0.1, max_workers=8, dr=16):
+    """
+    Match the positions of df to SDSS PhotoObj ('objects') or
+    SpecObj ('spects').
+
+    Arguments
+    ---------
+        df : DataFrame with positions in degrees
+        radius : match radius in arcsec
+        ra_col, dec_col : position columns of df
+        kind : 'objects' or 'spects'
+        nearest : keep only the nearest SDSS source of each position;
+                  otherwise all sources within radius
+        cell_size : cell size in degrees (one query per occupied cell)
+        max_workers : cells processed concurrently
+
+    Returns
+    -------
+        DataFrame of the matched rows of df joined with the SDSS columns
+        (suffixed '_sdss' when the names clash) and 'sep' in arcsec, in the
+        order of df and with the index of df (a row matched to several
+        sources appears once per source)
+    """
+    if kind not in ('objects', 'spects'):
+        raise Exception("kind should be 'objects' or 'spects'.")
+    ra = df[ra_col].to_numpy(dtype=float)
+    dec = df[dec_col].to_numpy(dtype=float)
+    cells = cell_ids(ra, dec, cell_size)
+    # row positions of df in each cell
+    groups = pd.Series(np.arange(len(df))).groupby(cells).indices
+
+    def run(item):
+        cell, rows = item
+        sdss = _fetch_cell(cell, cell_size, radius, kind, dr)
+        i1, i2, sep = match_coords(ra[rows], dec[rows], sdss['ra'], sdss['dec'],
+                                   radius, nearest=nearest)
+        return rows[i1], _join(df.iloc[rows[i1]], sdss.iloc[i2], sep)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        results = list(ex.map(run, groups.items()))
+    if not results:
+        # nothing queried: the SDSS columns are those of the cone search
+        sdss = pd.DataFrame(columns=COLUMNS[kind])
+        return _join(df.iloc[:0], sdss, np.array([], dtype=float))
+    # back in the order of df
+    rows = np.concatenate([r[0] for r in results])
+    order = np.argsort(rows, kind='stable')
+    # empty parts only give the columns; concatenating them would upcast
+    parts = [r[1] for r in results if len(r[1])] or [results[0][1]]
+    out = pd.concat(parts, ignore_index=True).iloc[order]
+    out.index = df.index[rows[order]]
+    return out
+
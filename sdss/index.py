@@ -0,0 +1,178 @@
+"""
+index module
+------------
+Local spatial index of downloaded objects, to answer cone searches of
+Region without querying SkyServer again.
+
+The index stores the rows returned by fGetNearbyObjAllEq/fGetNearbySpecObjEq
+queries grouped by sky cell (see sdss.sky), and records the cells whose
+whole area has been downloaded. A cone search touching only covered cells
+is answered locally; otherwise only the missing cells are fetched.
+
+    from sdss import Region
+    from sdss.index import SkyIndex
+
+    index = SkyIndex('objects')
+    for ra, dec in positions:
+        df = Region(ra, dec).nearest_objects(index=index)
+"""
+
+import numpy as np
+import pandas as pd
+from .sky import angsep, cell_ids, cell_circle, cone_cells
+from .utils import sql2df
+
+# rows fetched for one cell; a cell returning this many rows is not covered
+CELL_LIMIT = 500000
+
+# columns of objects_script and spects_script, without distance
+COLUMNS = {
+    'objects':['objID', 'type', 'specObjID', 'ra', 'dec', 'u', 'g', 'r', 'i', 'z'],
+    'spects':['objID', 'specObjID', 'ra', 'dec', 'class', 'subClass',
+              'u', 'g', 'r', 'i', 'z', 'redshift', 'zErr', 'zWarning'],
+}
+
+
+def objects_script(ra, dec, radius, n_max=None, max_g=None):
+    """Cone search of PhotoObj (radius in arcmin)"""
+    top = f"TOP {n_max} " if n_max is not None else ""
+    max_g = f"WHERE p.g<{max_g}" if max_g is not None else ""
+    return f"""SELECT {top}f.objID, f.type, f.distance,
+        p.specObjID, p.ra, p.dec, p.u, p.g, p.r, p.i, p.z
+        FROM dbo.fGetNearbyObjAllEq({ra},{dec},{radius}) AS f
+        JOIN PhotoObj AS p ON p.objID = f.objID {max_g}
+        ORDER BY f.distance"""
+
+
+def spects_script(ra, dec, radius, n_max=None):
+    """Cone search of SpecObj (radius in arcmin)"""
+    top = f"TOP {n_max} " if n_max is not None else ""
+    return f"""SELECT {top}
+        sp.objID, f.specObjID, f.distance, sp.ra, sp.dec, sp.class, sp.subClass,
+        sp.modelMag_u AS u, sp.modelMag_g AS g, sp.modelMag_r AS r, sp.modelMag_i AS i, sp.modelMag_z AS z,
+        f.z AS redshift, f.zErr, f.zWarning
+        FROM dbo.fGetNearbySpecObjEq({ra},{dec},{radius}) AS f
+        JOIN SpecPhoto AS sp ON sp.specObjID = f.specObjID
+        ORDER BY f.distance"""
+
+
+class SkyIndex:
+    """
+    Arguments
+    ---------
+        kind : 'objects' (nearest_objects) or 'spects' (nearest_spects)
+        cell_size : cell size in degrees
+        dr : data release queried for missing cells
+    """
+    def __init__(self, kind='objects', cell_size=0.05, dr=16):
+        if kind not in ('objects', 'spects'):
+            raise Exception("kind should be 'objects' or 'spects'.")
+        self.kind = kind
+        self.key = 'objID' if kind == 'objects' else 'specObjID'
+        self.cell_size = cell_size
+        self.dr = dr
+        self.covered = set()
+        # cell -> {column: array} of the rows lying in the cell
+        self._cells = {}
+        # empty frame with the columns of the indexed table
+        self._empty = None
+
+    def __len__(self):
+        return sum(len(arrays[self.key]) for arrays in self._cells.values())
+
+    @property
+    def df(self):
+        """All indexed rows"""
+        return self._frame(list(self._cells.values()))
+
+    def _frame(self, parts, rows=None):
+        # DataFrame of the rows of some cells (positions rows of their concatenation)
+        if self._empty is None:
+            return pd.DataFrame()
+        if not parts:
+            return self._empty.copy()
+        data = {}
+        for col in self._empty.columns:
+            values = np.concatenate([arrays[col] for arrays in parts])
+            data[col] = values if rows is None else values[rows]
+        return pd.DataFrame(data)
+
+    def add(self, df, ra=None, dec=None, radius=None):
+        """
+        Add the result of a cone search (radius in arcmin); the cells lying
+        entirely inside the cone are marked as covered. Without a cone the
+        rows are added but nothing is marked as covered.
+        """
+        df = df.drop(columns='distance', errors='ignore')
+        if self._empty is None or (len(self._empty.columns) == 0 and len(df.columns)):
+            # empty results are kept too: they carry the columns of the table
+            self._empty = df.iloc[:0].reset_index(drop=True)
+        if len(df):
+            self._add_rows(df)
+        if radius is None:
+            return
+        r = radius / 60
+        for cell in cone_cells(ra, dec, r, self.cell_size):
+            cra, cdec, crad = cell_circle(cell, self.cell_size)
+            if angsep(ra, dec, cra, cdec) + crad <= r:
+                self.covered.add(cell)
+
+    def _add_rows(self, df):
+        # only the cells receiving rows are touched, each deduplicated on the key
+        columns = {col:df[col].to_numpy() for col in self._empty.columns}
+        cells = cell_ids(columns['ra'], columns['dec'], self.cell_size)
+        order = np.argsort(cells, kind='stable')
+        uniq, start = np.unique(cells[order], return_index=True)
+        for cell, rows in zip(uniq.tolist(), np.split(order, start[1:])):
+            new = {col:values[rows] for col, values in columns.items()}
+            old = self._cells.get(cell)
+            if old is not None:
+                new = {col:np.concatenate([old[col], new[col]]) for col in new}
+            _, first = np.unique(new[self.key], return_index=True)
+            if len(first) < len(new[self.key]):
+                first.sort()
+                new = {col:values[first] for col, values in new.items()}
+            self._cells[cell] = new
+
+    def missing(self, ra, dec, radius):
+        """Cells of a cone (radius in arcmin) that are not covered"""
+        return [c for c in cone_cells(ra, dec, radius/60, self.cell_size)
+                if c not in self.covered]
+
+    def covers(self, ra, dec, radius):
+        return len(self.missing(ra, dec, radius)) == 0
+
+    def fetch(self, ra, dec, radius):
+        """Download the missing cells of a cone (radius in arcmin)"""
+        for cell in self.missing(ra, dec, radius):
+            cra, cdec, crad = cell_circle(cell, self.cell_size)
+            # a little margin so the circle surely contains the whole cell
+            r = crad * 60 * 1.001
+            if self.kind == 'objects':
+                script = objects_script(cra, cdec, r, n_max=CELL_LIMIT)
+            else:
+                script = spects_script(cra, cdec, r, n_max=CELL_LIMIT)
+            df = sql2df(script, dr=self.dr)
+            self.add(df)
+            if len(df) < CELL_LIMIT:
+                self.covered.add(cell)
+
+    def query(self, ra, dec, radius):
+        """
+        Indexed rows within radius (arcmin) of (ra, dec), with their
+        distance in arcmin, ordered by distance. Only complete for covered
+        cones.
+        """
+        parts = [self._cells[c] for c in cone_cells(ra, dec, radius/60, self.cell_size)
+                 if c in self._cells]
+        if parts:
+            ras = np.concatenate([arrays['ra'] for arrays in parts])
+            decs = np.concatenate([arrays['dec'] for arrays in parts])
+            dist = angsep(ra, dec, ras, decs) * 60
+            rows = np.flatnonzero(dist <= radius)
+            rows = rows[np.argsort(dist[rows], kind='stable')]
+        else:
+            dist = rows = np.array([], dtype=np.int64)
+        out = self._frame(parts, rows)
+        out.insert(min(2, len(out.columns)), 'distance', np.asarray(dist[rows], dtype=float))
+        return out
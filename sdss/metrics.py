@@ -0,0 +1,129 @@
+"""
+metrics module
+--------------
+Instrumentation of the network and compute hot paths.
+
+Disabled by default, in which case it costs one flag check per call. When
+enabled, every instrumented call records its wall time, and some add
+counters (bytes, rows, cache_hits, cache_misses, retries):
+
+    from sdss import metrics
+    metrics.enable()
+    ...
+    print(metrics.dump())          # text table
+    print(metrics.prometheus())    # Prometheus text format
+
+Callbacks receive each event as callback(name, seconds, fields); seconds is
+None for counter-only events.
+"""
+
+import functools, threading, time
+
+enabled = False
+
+_lock = threading.Lock()
+_stats = {}
+_callbacks = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def add_callback(callback):
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+def _entry(name):
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {'calls':0, 'errors':0, 'seconds':0.0, 'max_seconds':0.0}
+    return entry
+
+
+def record(name, seconds=None, **fields):
+    """Record a call of name taking seconds, and add fields to its counters"""
+    with _lock:
+        entry = _entry(name)
+        if seconds is not None:
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        for k, v in fields.items():
+            entry[k] = entry.get(k, 0) + v
+    for callback in _callbacks:
+        callback(name, seconds, fields)
+
+
+def timed(name):
+    """Decorator recording the wall time (and errors) of each call"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                record(name, time.perf_counter() - t, errors=1)
+                raise
+            record(name, time.perf_counter() - t)
+            return result
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Copy of the recorded statistics: name -> counters"""
+    with _lock:
+        return {name:dict(entry) for name, entry in _stats.items()}
+
+
+def dump():
+    """Statistics as a text table"""
+    lines = [f"{'name':32s} {'calls':>8s} {'total_s':>10s} {'mean_ms':>10s} {'max_ms':>10s}  counters"]
+    for name, e in sorted(stats().items()):
+        mean = e['seconds'] / e['calls'] * 1000 if e['calls'] else 0
+        extra = ' '.join(f"{k}={v}" for k, v in e.items()
+                         if k not in ('calls', 'seconds', 'max_seconds'))
+        lines.append(f"{name:32s} {e['calls']:8d} {e['seconds']:10.3f} {mean:10.2f} "
+                     f"{e['max_seconds']*1000:10.2f}  {extra}")
+    return '\n'.join(lines)
+
+
+def prometheus(prefix='sdss'):
+    """Statistics in the Prometheus text exposition format"""
+    data = stats()
+    metrics = {}
+    for name, e in data.items():
+        for k, v in e.items():
+            if k == 'max_seconds':
+                metric = f"{prefix}_call_max_seconds"
+            elif k == 'seconds':
+                metric = f"{prefix}_call_seconds_total"
+            else:
+                metric = f"{prefix}_{k}_total"
+            metrics.setdefault(metric, []).append((name, v))
+    lines = []
+    for metric, values in sorted(metrics.items()):
+        kind = 'gauge' if metric.endswith('_max_seconds') else 'counter'
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, v in values:
+            lines.append(f'{metric}{{name="{name}"}} {v}')
+    return '\n'.join(lines) + '\n'
@@ -1,10 +1,80 @@
-from urllib.request import urlopen, urlretrieve
-import matplotlib.pyplot as plt
-import pandas as pd
 from io import StringIO
-from .utils import (decode_objid, decode_specid, sql2df, binimg2array,
-                   img_cutout, show_spect, show_object)
+import numpy as np
+from .utils import (decode_objid, decode_specid, decode_objids, decode_specids,
+                   run2d_name, sql2df, binimg2array, img_cutout, show_spect, show_object)
 from .refs import photo_types
+from .transport import get_transport
+
+
+def _id_key(i):
+    # IDs come back from SkyServer as text; normalize for lookups
+    return str(int(i))
+
+
+def _id_chunks(ids, chunk_size):
+    """
+    Distinct IDs as text, chunk_size per list: IN (...) lists of queries,
+    short enough for the URL of one request
+    """
+    keys = list(dict.fromkeys(map(_id_key, ids)))
+    for k in range(0, len(keys), chunk_size):
+        yield keys[k:k+chunk_size]
+
+
+def _query_ids(script, ids, chunk_size=200, dr=16):
+    """
+    Rows of script for many IDs, with one query per chunk of IDs; script
+    has an {ids} placeholder for the list of IDs.
+    """
+    import pandas as pd
+    dfs = [sql2df(script.format(ids=','.join(chunk)), dr=dr)
+           for chunk in _id_chunks(ids, chunk_size)]
+    # empty chunks only give the columns; concatenating them would upcast
+    dfs = [df for df in dfs if len(df)] or dfs[:1]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+
+def _download_many(cls, ids, key, chunk_size=200):
+    # objects of cls for ids, filled from the rows of cls._many_script
+    objs = [cls(i) for i in ids]
+    by_id = {}
+    for obj in objs:
+        by_id.setdefault(_id_key(getattr(obj, key)), []).append(obj)
+    df = _query_ids(cls._many_script, by_id, chunk_size)
+    for row in df.to_dict('records'):
+        for obj in by_id.get(_id_key(row[key]), []):
+            obj._fill(row)
+    missing = []
+    for obj in objs:
+        obj.downloaded = True
+        if obj.ra is None:
+            missing.append(getattr(obj, key))
+    return objs, missing
+
+
+def _fetch_imgs(keys, dr=16):
+    """
+    Hex encoded spectrum images of specObjIDs (list of str) in one query.
+    Returns a dict of id key -> bytes (b'0x...'), sliced from the response
+    without going through str, so binimg2array decodes them directly.
+    """
+    from .utils import _sql_url
+    script = f"SELECT specObjID, img FROM SpecObj WHERE specObjID IN ({','.join(keys)})"
+    content = get_transport().content(_sql_url(script, dr))
+    view = memoryview(content)
+    out = {}
+    # skip the table name (#Table1) and header lines
+    pos = content.index(b'\n', content.index(b'\n') + 1) + 1
+    while pos < len(content):
+        end = content.find(b'\n', pos)
+        end = len(content) if end < 0 else end
+        stop = end - 1 if content[end-1:end] == b'\r' else end
+        if stop > pos:
+            comma = content.index(b',', pos, stop)
+            out[_id_key(content[pos:comma])] = bytes(view[comma+1:stop]) or None
+        pos = end + 1
+    return out
+
 
 class PhotoObj:
     def __init__(self, objID):
@@ -32,22 +102,41 @@ class PhotoObj:
         script = script + f"FROM PhotoObj WHERE objID={self.objID}"
         df = sql2df(script)
         if len(df)>0:
-            float_cols = ['ra','dec','u','g','r','i','z']
-            df[float_cols] = df[float_cols].astype(float)
-            self.specObjID = df['specObjID'].iloc[0]
-            self.ra = df['ra'].iloc[0]
-            self.dec = df['dec'].iloc[0]
-            u = df['u'].iloc[0]
-            g = df['g'].iloc[0]
-            r = df['r'].iloc[0]
-            i = df['i'].iloc[0]
-            z = df['z'].iloc[0]
-            self.mag = {'u':u, 'g':g, 'r':r, 'i':i, 'z':z}
-            self.type = photo_types[df['type'].iloc[0]]
+            self._fill(df.to_dict('records')[0])
             if get_image:
                 self.img_array = self.quick_image()
         self.downloaded = True
 
+    async def async_download(self, get_image=False):
+        from . import aio
+        await aio.run_blocking('sql', self.download, get_image=get_image)
+
+    def _fill(self, row):
+        self.specObjID = str(row['specObjID'])
+        self.ra = float(row['ra'])
+        self.dec = float(row['dec'])
+        self.mag = {b:float(row[b]) for b in 'ugriz'}
+        self.type = photo_types[str(row['type'])]
+
+    _many_script = "SELECT objID,specObjID,ra,dec,u,g,r,i,z,type FROM PhotoObj WHERE objID IN ({ids})"
+
+    @classmethod
+    def download_many(cls, objIDs, chunk_size=200):
+        """
+        Download many photo objects with one query per chunk of IDs.
+
+        Arguments
+        ---------
+            objIDs : list of objIDs
+            chunk_size : number of IDs per query
+
+        Returns
+        -------
+            objs : list of downloaded PhotoObj (in the order of objIDs)
+            missing : list of objIDs not found in PhotoObj
+        """
+        return _download_many(cls, objIDs, 'objID', chunk_size)
+
     def cutout_image(self, scale=0.1, width=300, height=300):
         if not self.downloaded:
             self.download()
@@ -58,6 +147,7 @@ class PhotoObj:
         return data
 
     def show(self, scale=0.1, width=200, height=200):
+        import matplotlib.pyplot as plt
         data = self.cutout_image(scale=scale, width=width, height=height)
         plt.imshow(data)
         plt.axis('off') # new
@@ -83,7 +173,8 @@ class SpecObj:
         self.zWarning = None
         self.mainClass = None
         self.subClass = None
-        self.img = None
+        self._img = None
+        self._img_fetched = False
         self.dist2sel = None
         self.downloaded = False
         
@@ -95,52 +186,115 @@ class SpecObj:
         self.field = None
         
 
+    _columns = """s.specObjID, s.bestObjID, s.ra, s.dec, p.u, p.g, p.r, p.i, p.z, p.type,
+        s.z AS redshift, s.zErr, s.zWarning, s.class, s.subClass"""
+    _many_script = f"""SELECT {_columns}
+        FROM SpecObj AS s
+        JOIN PhotoObj AS p ON s.bestObjID=p.objID
+        WHERE s.specObjID IN ({{ids}})"""
+
     def download(self):
-        script = f"""SELECT s.bestObjID, s.ra, s.dec, p.u, p.g, p.r, p.i, p.z, p.type,
-        s.z AS redshift, s.zErr, s.zWarning, s.class, s.subClass, s.img
+        script = f"""SELECT {self._columns}
         FROM SpecObj AS s
         JOIN PhotoObj AS p ON s.bestObjID=p.objID
         WHERE s.specObjID={self.specObjID}"""
         df = sql2df(script)
         if len(df)>0:
-            float_cols = ['ra','dec','u','g','r','i','z', 'redshift','zErr']
-            df[float_cols] = df[float_cols].astype(float)
-            self.bestObjID = df['bestObjID'].iloc[0]
-            self.ra = df['ra'].iloc[0]
-            self.dec = df['dec'].iloc[0]
-            u = df['u'].iloc[0]
-            g = df['g'].iloc[0]
-            r = df['r'].iloc[0]
-            i = df['i'].iloc[0]
-            z = df['z'].iloc[0]
-            self.mag = {'u':u, 'g':g, 'r':r, 'i':i, 'z':z}
-            self.type = photo_types[df['type'].iloc[0]]
-            self.z = df['redshift'].iloc[0]
-            self.zErr = df['zErr'].iloc[0]
-            self.zWarning = df['zWarning'].iloc[0]
-            self.mainClass = df['class'].iloc[0]
-            self.subClass = df['subClass'].iloc[0]
-            self.img = df['img'].iloc[0]
+            self._fill(df.to_dict('records')[0])
         self.downloaded = True
 
+    async def async_download(self):
+        from . import aio
+        await aio.run_blocking('sql', self.download)
+
+    def _fill(self, row):
+        self.bestObjID = str(row['bestObjID'])
+        self.ra = float(row['ra'])
+        self.dec = float(row['dec'])
+        self.mag = {b:float(row[b]) for b in 'ugriz'}
+        self.type = photo_types[str(row['type'])]
+        self.z = float(row['redshift'])
+        self.zErr = float(row['zErr'])
+        self.zWarning = row['zWarning']
+        self.mainClass = row['class']
+        self.subClass = row['subClass']
+
+    @property
+    def img(self):
+        """
+        Hex encoded JPEG image of the spectrum (bytes, b'0x...'), fetched
+        on first access
+        """
+        if not self._img_fetched:
+            self._img = _fetch_imgs([_id_key(self.specObjID)]).get(_id_key(self.specObjID))
+            self._img_fetched = True
+        return self._img
+
+    @img.setter
+    def img(self, value):
+        self._img = value
+        self._img_fetched = True
+
+    def img_array(self):
+        """Image of the spectrum as an array"""
+        return binimg2array(self.img)
+
+    @classmethod
+    def fetch_images(cls, objs, chunk_size=50):
+        """
+        Fetch the images of many SpecObj with one query per chunk.
+        Objects whose image is already fetched are skipped.
+        """
+        by_id = {}
+        for obj in objs:
+            if not obj._img_fetched:
+                by_id.setdefault(_id_key(obj.specObjID), []).append(obj)
+        for chunk in _id_chunks(by_id, chunk_size):
+            for i, img in _fetch_imgs(chunk).items():
+                for obj in by_id.get(i, []):
+                    obj.img = img
+        for objs_k in by_id.values():
+            for obj in objs_k:
+                obj._img_fetched = True
+
+    @classmethod
+    def download_many(cls, specObjIDs, chunk_size=200):
+        """
+        Download many spectroscopic objects with one query per chunk of IDs.
+
+        Arguments
+        ---------
+            specObjIDs : list of specObjIDs
+            chunk_size : number of IDs per query
+
+        Returns
+        -------
+            objs : list of downloaded SpecObj (in the order of specObjIDs)
+            missing : list of specObjIDs not found in SpecObj
+        """
+        return _download_many(cls, specObjIDs, 'specObjID', chunk_size)
+
     def show_spec(self, figsize=None):
+        import matplotlib.pyplot as plt
         if not self.downloaded:
             self.download()
         if figsize is None:
             fig, ax = plt.subplots()
         else:
             fig, ax = plt.subplots(figsize=figsize)
-        data = binimg2array(self.img)
+        data = self.img_array()
         ax.imshow(data, cmap='gray')
         plt.axis('off') # new
         plt.show()
 
     def spec_url(self, path='', lite=True):
-        run2d = str(self.run2d)
+        run2d = run2d_name(self.run2d)
         plate = str(self.plate).zfill(4)
         mjd = str(self.mjd).zfill(5)
         fiber = str(self.fiberID).zfill(4)
-        BASE = "https://dr16.sdss.org/sas/dr16/sdss/spectro/redux/"
+        # SDSS-I/II spectra are under sdss/, BOSS and eBOSS ones under eboss/
+        survey = 'sdss' if run2d.isdigit() else 'eboss'
+        BASE = f"https://dr16.sdss.org/sas/dr16/{survey}/spectro/redux/"
         if lite:
             PAR = f"{run2d}/spectra/lite/{plate}/"
         else:
@@ -157,17 +311,381 @@ class SpecObj:
             url = self.spec_url(path=path, lite=lite)
             if filename is None:
                 filename = url.split('/')[-1]
-            urlretrieve(url, path+filename)
+            get_transport().download(url, path+filename)
         else:
             BASE = 'http://dr16.sdss.org/optical/spectrum/view/data/format=csv?'
-            PAR = f"plateid={self.plate}&mjd={self.mjd}&fiberid={self.fiberID}&reduction2d=v5_7_0"
+            PAR = f"plateid={self.plate}&mjd={self.mjd}&fiberid={self.fiberID}&reduction2d={run2d_name(self.run2d)}"
             url = BASE + PAR
             if filename is None:
                 filename = f"spec-{self.plate}-{self.mjd}-{self.fiberID}.csv"
-            urlretrieve(url, path+filename)
+            get_transport().download(url, path+filename)
 
     def spec_df(self):
+        import pandas as pd
         BASE = 'http://dr16.sdss.org/optical/spectrum/view/data/format=csv?'
-        PAR = f"plateid={self.plate}&mjd={self.mjd}&fiberid={self.fiberID}&reduction2d=v5_7_0"
-        r = urlopen(BASE+PAR).read().decode('utf-8')
+        PAR = f"plateid={self.plate}&mjd={self.mjd}&fiberid={self.fiberID}&reduction2d={run2d_name(self.run2d)}"
+        r = get_transport().content(BASE+PAR).decode('utf-8')
         return pd.read_csv(StringIO(r))
+
+    async def async_spec_df(self):
+        from . import aio
+        return await aio.run_blocking('spectrum', self.spec_df)
+
+    async def async_download_spec(self, path='', filename=None, lite=True, fits=True):
+        from . import aio
+        await aio.run_blocking('sas' if fits else 'spectrum', self.download_spec,
+                           path=path, filename=filename, lite=lite, fits=fits)
+
+
+def _column(name, conv=None):
+    """Property reading one row of a collection column"""
+    if conv is None:
+        return property(lambda self: self._coll._cols[name][self._i])
+    return property(lambda self: conv(self._coll._cols[name][self._i]))
+
+
+class _Collection:
+    """
+    Objects stored as NumPy columns, with rows exposed as views.
+
+    Arguments
+    ---------
+        columns : dict of column name -> 1-D numpy array (all of one length)
+        categories : dict of column name -> labels, for columns stored as
+                     integer codes (-1 for missing values)
+    """
+    _dtypes = {}
+    _key = None
+    _view = None
+    _script = None
+    _decoder = None
+
+    def __init__(self, columns, categories=None):
+        self._cols = dict(columns)
+        self._categories = dict(categories) if categories is not None else {}
+        self._decoded = None
+
+    @classmethod
+    def from_df(cls, df):
+        """Build a collection from a DataFrame with the columns of _dtypes"""
+        import pandas as pd
+        from .utils import _as_uint64
+        cols, cats = {}, {}
+        for name, dtype in cls._dtypes.items():
+            values = df[name]
+            if dtype is None:
+                codes, labels = pd.factorize(values)
+                cols[name] = codes.astype(np.int16)
+                cats[name] = np.asarray(labels, dtype=str)
+            elif dtype == np.uint64:
+                cols[name] = _as_uint64(values)
+            else:
+                cols[name] = values.to_numpy(dtype=dtype)
+        return cls(cols, cats)
+
+    @classmethod
+    def download(cls, ids, chunk_size=200, dr=16):
+        """
+        Download many objects with one query per chunk of IDs.
+
+        Arguments
+        ---------
+            ids : list, numpy array or pandas Series of IDs
+            chunk_size : number of IDs per query
+            dr : data release
+
+        Returns
+        -------
+            objs : collection of the objects found (in the order of ids)
+            missing : list of IDs not found
+        """
+        from .utils import _as_uint64
+        ids = _as_uint64(ids)
+        df = _query_ids(cls._script, np.unique(ids).tolist(), chunk_size, dr=dr)
+        if len(df):
+            got = cls.from_df(df)
+        else:
+            got = cls({name:np.array([], dtype=np.int16 if dtype is None else dtype)
+                       for name, dtype in cls._dtypes.items()},
+                      {name:np.array([], dtype=str) for name, dtype in cls._dtypes.items()
+                       if dtype is None})
+        key = got._cols[cls._key]
+        order = np.argsort(key, kind='stable')
+        pos = np.searchsorted(key[order], ids)
+        found = pos < len(key)
+        found[found] = key[order][pos[found]] == ids[found]
+        missing = [str(i) for i in ids[~found].tolist()]
+        return got[order[pos[found]]], missing
+
+    def __len__(self):
+        return len(self._cols[self._key])
+
+    def __iter__(self):
+        view = self._view
+        for i in range(len(self)):
+            yield view(self, i)
+
+    def __getitem__(self, key):
+        """
+        Column (by name), row view (by position), or a new collection
+        (slice, boolean mask or array of positions)
+        """
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, (int, np.integer)):
+            n = len(self)
+            if not -n <= key < n:
+                raise IndexError('collection index out of range')
+            return self._view(self, int(key) % n)
+        return self.take(key)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} of {len(self)} objects>"
+
+    @property
+    def columns(self):
+        return list(self._cols)
+
+    @property
+    def nbytes(self):
+        """Memory used by the columns in bytes"""
+        return sum(v.nbytes for v in self._cols.values())
+
+    def decoded(self):
+        """Fields decoded from the IDs (structured array), computed once"""
+        if self._decoded is None:
+            self._decoded = self._decoder(self._cols[self._key])
+        return self._decoded
+
+    def column(self, name):
+        """
+        Column as an array; categorical columns are returned as labels and
+        the fields decoded from the IDs can be used as columns too.
+        """
+        if name in self._categories:
+            codes = self._cols[name]
+            labels = np.append(self._categories[name], '')
+            return labels[codes]
+        if name in self._cols:
+            return self._cols[name]
+        decoded = self.decoded()
+        if name in decoded.dtype.names:
+            return decoded[name]
+        raise KeyError(name)
+
+    def take(self, rows):
+        """New collection with the given rows (slice, mask or positions)"""
+        if isinstance(rows, list):
+            rows = np.asarray(rows, dtype=bool if rows and isinstance(rows[0], bool) else np.int64)
+        new = type(self)({k:v[rows] for k, v in self._cols.items()}, self._categories)
+        if self._decoded is not None:
+            new._decoded = self._decoded[rows]
+        return new
+
+    def filter(self, mask):
+        """Rows where mask is True, e.g. objs.filter(objs['r'] < 18)"""
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def sort(self, by, ascending=True):
+        """
+        Sorted copy of the collection.
+
+        Arguments
+        ---------
+            by : column name or list of names (the first is the primary key)
+            ascending : sort order
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        order = np.lexsort([self.column(name) for name in reversed(by)])
+        if not ascending:
+            order = order[::-1]
+        return self.take(order)
+
+    def to_DataFrame(self, copy=False):
+        """
+        Columns as a pandas DataFrame; numeric columns share memory with
+        the collection unless copy is True.
+        """
+        import pandas as pd
+        data = {}
+        for name, values in self._cols.items():
+            if name in self._categories:
+                values = pd.Categorical.from_codes(values, self._categories[name])
+            data[name] = values
+        return pd.DataFrame(data, copy=copy)
+
+
+class PhotoObjView:
+    """Row of a PhotoObjCollection; has the attributes of a downloaded PhotoObj"""
+    __slots__ = ('_coll', '_i')
+    downloaded = True
+    dist2sel = None
+
+    def __init__(self, coll, i):
+        self._coll = coll
+        self._i = i
+
+    def _decoded(self, name):
+        return int(self._coll.decoded()[name][self._i])
+
+    objID = _column('objID', _id_key)
+    specObjID = _column('specObjID', _id_key)
+    ra = _column('ra', float)
+    dec = _column('dec', float)
+    type = _column('type', lambda t: photo_types[str(t)])
+    sky_version = property(lambda self: self._decoded('version'))
+    rerun = property(lambda self: self._decoded('rerun'))
+    run = property(lambda self: self._decoded('run'))
+    camcol = property(lambda self: self._decoded('camcol'))
+    field = property(lambda self: self._decoded('field'))
+    id_in_field = property(lambda self: self._decoded('id_within_field'))
+
+    @property
+    def mag(self):
+        cols, i = self._coll._cols, self._i
+        return {b:float(cols[b][i]) for b in 'ugriz'}
+
+    def __repr__(self):
+        return f"<PhotoObjView objID={self.objID}>"
+
+    cutout_image = PhotoObj.cutout_image
+    show = PhotoObj.show
+
+
+class SpecObjView:
+    """Row of a SpecObjCollection; has the attributes of a downloaded SpecObj"""
+    __slots__ = ('_coll', '_i')
+    downloaded = True
+    dist2sel = None
+
+    def __init__(self, coll, i):
+        self._coll = coll
+        self._i = i
+
+    def _decoded(self, name):
+        return int(self._coll.decoded()[name][self._i])
+
+    def _label(self, name):
+        code = self._coll._cols[name][self._i]
+        return self._coll._categories[name][code] if code >= 0 else None
+
+    specObjID = _column('specObjID', _id_key)
+    bestObjID = _column('bestObjID', _id_key)
+    ra = _column('ra', float)
+    dec = _column('dec', float)
+    z = _column('redshift', float)
+    zErr = _column('zErr', float)
+    zWarning = _column('zWarning', int)
+    type = _column('type', lambda t: photo_types[str(t)])
+    mainClass = property(lambda self: self._label('class'))
+    subClass = property(lambda self: self._label('subClass'))
+    plate = property(lambda self: self._decoded('plate'))
+    fiberID = property(lambda self: self._decoded('fiber_id'))
+    mjd = property(lambda self: self._decoded('mjd'))
+    run2d = property(lambda self: self._coll.decoded()['run2d'][self._i])
+    run = camcol = field = None
+
+    @property
+    def mag(self):
+        cols, i = self._coll._cols, self._i
+        return {b:float(cols[b][i]) for b in 'ugriz'}
+
+    @property
+    def img(self):
+        """Hex encoded JPEG image of the spectrum, fetched on first access"""
+        imgs = self._coll._imgs()
+        if imgs[self._i] is None:
+            self._coll.fetch_images(rows=[self._i])
+        return imgs[self._i] or None
+
+    @img.setter
+    def img(self, value):
+        self._coll._imgs()[self._i] = value
+
+    def __repr__(self):
+        return f"<SpecObjView specObjID={self.specObjID}>"
+
+    img_array = SpecObj.img_array
+    show_spec = SpecObj.show_spec
+    spec_url = SpecObj.spec_url
+    download_spec = SpecObj.download_spec
+    spec_df = SpecObj.spec_df
+    async_spec_df = SpecObj.async_spec_df
+    async_download_spec = SpecObj.async_download_spec
+
+
+class PhotoObjCollection(_Collection):
+    """
+    Photo objects stored as NumPy columns (objID, specObjID, ra, dec, u, g,
+    r, i, z, type). Indexing by position gives a PhotoObjView, which behaves
+    like a downloaded PhotoObj:
+
+        objs, missing = PhotoObjCollection.download(objIDs)
+        bright = objs.filter(objs['r'] < 18).sort('r')
+        bright[0].mag, bright[0].type
+        df = bright.to_DataFrame()
+    """
+    _dtypes = {'objID':np.uint64, 'specObjID':np.uint64,
+               'ra':np.float64, 'dec':np.float64,
+               'u':np.float64, 'g':np.float64, 'r':np.float64,
+               'i':np.float64, 'z':np.float64, 'type':np.int8}
+    _key = 'objID'
+    _view = PhotoObjView
+    _script = PhotoObj._many_script
+    _decoder = staticmethod(decode_objids)
+
+
+class SpecObjCollection(_Collection):
+    """
+    Spectroscopic objects stored as NumPy columns (specObjID, bestObjID, ra,
+    dec, u, g, r, i, z, type, redshift, zErr, zWarning, class, subClass);
+    class and subClass are stored as integer codes. Indexing by position
+    gives a SpecObjView, which behaves like a downloaded SpecObj.
+    """
+    _dtypes = {'specObjID':np.uint64, 'bestObjID':np.uint64,
+               'ra':np.float64, 'dec':np.float64,
+               'u':np.float64, 'g':np.float64, 'r':np.float64,
+               'i':np.float64, 'z':np.float64, 'type':np.int8,
+               'redshift':np.float64, 'zErr':np.float64, 'zWarning':np.int32,
+               'class':None, 'subClass':None}
+    _key = 'specObjID'
+    _view = SpecObjView
+    _script = SpecObj._many_script
+    _decoder = staticmethod(decode_specids)
+
+    def __init__(self, columns, categories=None):
+        super().__init__(columns, categories)
+        self._img = None
+
+    def _imgs(self):
+        if self._img is None:
+            self._img = np.full(len(self), None, dtype=object)
+        return self._img
+
+    def take(self, rows):
+        new = super().take(rows)
+        if self._img is not None:
+            new._img = self._img[rows]
+        return new
+
+    def fetch_images(self, rows=None, chunk_size=50, dr=16):
+        """
+        Fetch the images of the spectra with one query per chunk; rows
+        whose image is already fetched are skipped.
+        """
+        imgs = self._imgs()
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        rows = rows[np.array([imgs[i] is None for i in rows], dtype=bool)]
+        ids = self._cols['specObjID']
+        by_id = {}
+        for i in rows.tolist():
+            by_id.setdefault(_id_key(ids[i]), []).append(i)
+        for chunk in _id_chunks(by_id, chunk_size):
+            for i, img in _fetch_imgs(chunk, dr=dr).items():
+                for row in by_id.get(i, []):
+                    imgs[row] = img
+        # mark rows without image as fetched
+        for rows_k in by_id.values():
+            for row in rows_k:
+                if imgs[row] is None:
+                    imgs[row] = b''
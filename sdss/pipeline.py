@@ -0,0 +1,199 @@
+"""
+pipeline module
+---------------
+Aperture photometry of many photo objects, one process per field.
+
+The objIDs are grouped by field, their positions are fetched with one
+query per chunk of objIDs, and each field runs as one task of a process
+pool: download and decompress the frames (through a FrameStore), convert
+ra/dec to pixels with the WCS of the frame, and measure the fluxes with
+aperture_photometry. Workers open the decompressed frames memory-mapped,
+so pixel data is never pickled between processes, and processes working
+on the same frame share its pages.
+
+    from sdss.pipeline import field_photometry
+    df, timings = field_photometry(objids, bands='gr', out='fluxes.parquet')
+
+Results are collected as the fields complete; with out they are appended
+to one Parquet file instead of being kept in memory.
+"""
+
+import copy, os, time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from .utils import decode_objids, require_parquet
+from .transport import get_transport
+
+STAGES = ('positions', 'download', 'wcs', 'photometry')
+
+
+def _init_worker(transport):
+    from . import transport as t
+    # never reuse connections inherited from the parent process
+    t._transport = transport
+
+
+def _field_task(store, run, camcol, field, rerun, bands, objid, ra, dec,
+                r_star, r_inter, r_sky, clip, gain):
+    """Photometry of the objects of one field; runs in a worker process"""
+    import pandas as pd
+    from astropy.io import fits
+    from .photometry import frame_wcs, aperture_photometry
+    timings = dict.fromkeys(STAGES[1:], 0.0)
+    parts = []
+    for band in bands:
+        t = time.perf_counter()
+        filename = store.get(run, camcol, field, band, rerun=rerun)
+        timings['download'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        x, y = frame_wcs(filename).world_to_pixel_values(ra, dec)
+        timings['wcs'] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        with fits.open(filename, memmap=True) as hdul:
+            df = aperture_photometry(hdul[0].data, x, y, r_star, r_inter=r_inter,
+                                     r_sky=r_sky, clip=clip, gain=gain)
+        timings['photometry'] += time.perf_counter() - t
+        df.insert(0, 'band', band)
+        parts.append(df)
+    df = pd.concat(parts, ignore_index=True)
+    n = len(objid)
+    df.insert(0, 'objID', np.tile(objid, len(bands)))
+    df.insert(1, 'run', np.full(n*len(bands), run, dtype=np.int32))
+    df.insert(2, 'camcol', np.full(n*len(bands), camcol, dtype=np.int32))
+    df.insert(3, 'field', np.full(n*len(bands), field, dtype=np.int32))
+    df.insert(5, 'ra', np.tile(ra, len(bands)))
+    df.insert(6, 'dec', np.tile(dec, len(bands)))
+    return df, timings
+
+
+def group_fields(objids):
+    """
+    Group objIDs by field.
+
+    Returns a dict of (run, camcol, field, rerun) -> positions in objids
+    """
+    dc = decode_objids(objids)
+    keys = np.stack([dc['run'], dc['camcol'], dc['field'], dc['rerun']], axis=1)
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    start = np.searchsorted(inverse[order], np.arange(len(uniq)))
+    return {tuple(int(v) for v in key):rows
+            for key, rows in zip(uniq, np.split(order, start[1:]))}
+
+
+def iter_field_photometry(objids, bands='r', r_star=5, r_inter=None, r_sky=None,
+                          clip=0.2, gain=1.0, store=None, workers=None, dr=16):
+    """
+    Run the pipeline and yield (df, timings) for each field as it completes.
+
+    df holds one row per object and band (objID, run, camcol, field, band,
+    ra, dec, x, y and the columns of aperture_photometry); timings is a dict
+    with run, camcol, field, n (objects), the seconds spent in each stage
+    and error (None, or the message of the exception that failed the field).
+    The first item is (None, timings) of the position query, made in the
+    parent process before the fields are submitted.
+
+    Each worker process has its own scheduler (see sdss.scheduler), with
+    the rate and concurrency limits of the transport divided by workers.
+    """
+    from .objects import PhotoObjCollection
+    from .store import FrameStore
+    if store is None:
+        store = FrameStore()
+    workers = workers or os.cpu_count()
+
+    t = time.perf_counter()
+    objs, missing = PhotoObjCollection.download(objids, dr=dr)
+    error = f"{len(missing)} objIDs not found" if missing else None
+    yield None, {'run':None, 'camcol':None, 'field':None, 'n':len(objs),
+                 **dict.fromkeys(STAGES, 0.0), 'positions':time.perf_counter() - t,
+                 'error':error}
+    ids, ra, dec = objs['objID'], objs['ra'], objs['dec']
+    tasks = iter(group_fields(ids).items())
+
+    transport = copy.copy(get_transport())
+    if transport.scheduler:
+        # each worker paces its own requests: share the budgets between them
+        transport.scheduler = transport.scheduler.split(workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(transport,)) as ex:
+        running = {}
+
+        def submit():
+            for (run, camcol, field, rerun), rows in tasks:
+                fut = ex.submit(_field_task, store, run, camcol, field, rerun, bands,
+                                ids[rows], ra[rows], dec[rows],
+                                r_star, r_inter, r_sky, clip, gain)
+                running[fut] = {'run':run, 'camcol':camcol, 'field':field, 'n':len(rows)}
+                if len(running) >= 2 * workers:
+                    return
+
+        submit()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                info = running.pop(fut)
+                try:
+                    df, timings = fut.result()
+                except Exception as e:
+                    yield None, {**info, **dict.fromkeys(STAGES, np.nan), 'error':str(e)}
+                    continue
+                yield df, {**info, 'positions':0.0, **timings, 'error':None}
+            submit()
+
+
+def field_photometry(objids, bands='r', r_star=5, r_inter=None, r_sky=None,
+                     clip=0.2, gain=1.0, store=None, workers=None, out=None, dr=16):
+    """
+    Aperture photometry of photo objects, one process pool task per field.
+
+    Arguments
+    ---------
+        objids : list, numpy array or pandas Series of objIDs
+        bands : bands to measure, e.g. 'gri'
+        r_star, r_inter, r_sky, clip, gain : see photometry.aperture_photometry
+        store : FrameStore holding the frames (default: FrameStore())
+        workers : number of processes (default: number of CPUs)
+        out : Parquet file the results are appended to as fields complete
+        dr : data release of the position query
+
+    Returns
+    -------
+        df : results (see iter_field_photometry); None if out is given
+        timings : DataFrame of the seconds spent per field and stage; the
+                  first row is the position query of the parent process
+
+    objIDs not found in PhotoObj have no rows; their number is reported in
+    the error column of the first timings row.
+    """
+    import pandas as pd
+    if out is not None:
+        require_parquet()
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    parts, rows, writer = [], [], None
+    try:
+        for df, timings in iter_field_photometry(
+                objids, bands=bands, r_star=r_star, r_inter=r_inter, r_sky=r_sky,
+                clip=clip, gain=gain, store=store, workers=workers, dr=dr):
+            rows.append(timings)
+            if df is None:
+                continue
+            if out is None:
+                parts.append(df)
+                continue
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    timings = pd.DataFrame(rows)
+    if out is not None:
+        return None, timings
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    return df, timings
@@ -1,9 +1,26 @@
-from urllib.request import urlopen, urlretrieve
-import matplotlib.pyplot as plt
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from .utils import (decode_objid, decode_specid, sql2df, binimg2array,
                     img_cutout, show_spect, show_object)
 
 
+def _tan_to_sky(ra0, dec0, xi, eta):
+    """ra, dec of gnomonic coordinates xi, eta around (ra0, dec0); radians"""
+    denom = np.cos(dec0) - eta * np.sin(dec0)
+    ra = ra0 + np.arctan2(xi, denom)
+    dec = np.arctan2(np.sin(dec0) + eta * np.cos(dec0), np.hypot(xi, denom))
+    return ra, dec
+
+
+def _sky_to_tan(ra0, dec0, ra, dec):
+    """Gnomonic coordinates xi, eta of ra, dec around (ra0, dec0); radians"""
+    cos_c = np.sin(dec0)*np.sin(dec) + np.cos(dec0)*np.cos(dec)*np.cos(ra - ra0)
+    xi = np.cos(dec) * np.sin(ra - ra0) / cos_c
+    eta = (np.cos(dec0)*np.sin(dec) - np.sin(dec0)*np.cos(dec)*np.cos(ra - ra0)) / cos_c
+    return xi, eta
+
+
 class Region:
     # fov in degrees
     def __init__(self, ra, dec, fov=0.033, width=300, height=300, opt='GS', query=''):
@@ -14,6 +31,8 @@ class Region:
         self.opt = opt
         self.query = query
         self.data = None
+        self.mosaic = None
+        self.pyramid = None
     
     def download_data(self):
         scale = self.fov * (0.396127 / 0.033)
@@ -21,7 +40,85 @@ class Region:
                                width=self.width, height=self.height,
                                opt=self.opt, query=self.query)
 
+    async def async_download_data(self):
+        from .aio import async_img_cutout
+        scale = self.fov * (0.396127 / 0.033)
+        self.data = await async_img_cutout(ra=self.ra, dec=self.dec, scale=scale,
+                                           width=self.width, height=self.height,
+                                           opt=self.opt, query=self.query)
+
+    def _offsets_to_sky(self, dx, dy, scale):
+        # pixel offsets from the center of the region (x to the west, y to
+        # the south) in its gnomonic projection -> ra, dec in radians
+        xi = np.radians(-np.asarray(dx) * scale / 3600)
+        eta = np.radians(-np.asarray(dy) * scale / 3600)
+        return _tan_to_sky(math.radians(self.ra), math.radians(self.dec), xi, eta)
+
+    def download_mosaic(self, width, height, scale=None, tile=1024,
+                        max_workers=8, out=None, levels=4):
+        """
+        Image of a field larger than one cutout, fetched as tiles.
+
+        Arguments
+        ---------
+            width, height : size of the mosaic in pixels
+            scale : arcsec per pixel (default: the scale of download_data)
+            tile : tile size in pixels (at most 2048, the cutout limit)
+            max_workers : number of tiles fetched concurrently
+            out : None for an in-memory array, or a .npy filename for a
+                  memory-mapped one
+            levels : number of reduced-resolution levels in self.pyramid
+
+        The mosaic is kept in self.mosaic and returned; self.pyramid holds
+        it downsampled by 2, 4, ... for previews. opt and query of the
+        region are applied to each tile.
+
+        The mosaic is one gnomonic (TAN) projection centered on the region,
+        north up at its center. Each cutout is north up at its own center,
+        so away from the equator it is rotated against the mosaic by about
+        the ra difference times sin(dec): tiles are fetched with the margin
+        this needs and resampled (nearest pixel) onto the mosaic grid.
+        """
+        if scale is None:
+            scale = self.fov * (0.396127 / 0.033)
+        if out is None:
+            mosaic = np.zeros((height, width, 3), dtype=np.uint8)
+        else:
+            mosaic = np.lib.format.open_memmap(out, mode='w+', dtype=np.uint8,
+                                               shape=(height, width, 3))
+        tiles = [(x0, y0, min(tile, width-x0), min(tile, height-y0))
+                 for y0 in range(0, height, tile) for x0 in range(0, width, tile)]
+
+        def fetch(t):
+            x0, y0, tw, th = t
+            ra, dec = self._offsets_to_sky(x0 + tw/2 - width/2, y0 + th/2 - height/2, scale)
+            # position of each mosaic pixel of the tile in the cutout
+            # projection, in pixels from the cutout center
+            cols = np.arange(x0, x0+tw) + 0.5 - width/2
+            rows = np.arange(y0, y0+th) + 0.5 - height/2
+            pra, pdec = self._offsets_to_sky(cols[None, :], rows[:, None], scale)
+            xi, eta = _sky_to_tan(ra, dec, pra, pdec)
+            sx = -np.degrees(xi) * 3600 / scale
+            sy = -np.degrees(eta) * 3600 / scale
+            cw = min(2*int(np.ceil(np.abs(sx).max())) + 2, 2048)
+            ch = min(2*int(np.ceil(np.abs(sy).max())) + 2, 2048)
+            data = img_cutout(ra=math.degrees(ra) % 360, dec=math.degrees(dec),
+                              scale=scale, width=cw, height=ch,
+                              opt=self.opt, query=self.query)
+            ix = np.clip(np.floor(sx + cw/2).astype(int), 0, cw-1)
+            iy = np.clip(np.floor(sy + ch/2).astype(int), 0, ch-1)
+            mosaic[y0:y0+th, x0:x0+tw] = data[iy, ix, :3]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            list(ex.map(fetch, tiles))
+        if out is not None:
+            mosaic.flush()
+        self.mosaic = mosaic
+        self.pyramid = build_pyramid(mosaic, levels=levels)
+        return mosaic
+
     def show(self, band='all', figsize=None):
+        import matplotlib.pyplot as plt
         if self.data is None:
             self.download_data()
         if isinstance(figsize, tuple) and len(figsize)==2:
@@ -40,6 +137,7 @@ class Region:
         plt.show()
 
     def show3b(self, figsize=None):
+        import matplotlib.pyplot as plt
         if self.data is None:
             self.download_data()
         if isinstance(figsize, tuple) and len(figsize)==2:
@@ -53,38 +151,57 @@ class Region:
             axes[i].axis('off')
         plt.show()
     
-    def nearest_objects(self, radius=None, n_max=1000, max_g=None):
+    def nearest_objects(self, radius=None, n_max=1000, max_g=None, index=None):
         """
         radius : arcmin
+        index : optional sdss.index.SkyIndex('objects'); the search is then
+                answered from it, fetching only the cells it does not cover
         """
+        from .index import objects_script
         if radius is None:
             radius = (self.fov * 60) /2
-        max_g = f"WHERE p.g<{max_g}" if max_g is not None else ""
-        scrip = f"""SELECT TOP {n_max} f.objID, f.type, f.distance,
-        p.specObjID, p.ra, p.dec, p.u, p.g, p.r, p.i, p.z
-        FROM dbo.fGetNearbyObjAllEq({self.ra},{self.dec},{radius}) AS f
-        JOIN PhotoObj AS p ON p.objID = f.objID {max_g}
-        ORDER BY f.distance"""
-        df = sql2df(scrip)
-        float_cols = ['distance','ra','dec','u','g','r','i','z']
-        df[float_cols] = df[float_cols].astype(float)
-        return df
-
-    def nearest_spects(self, radius=None, n_max=1000):
+        if index is None:
+            return sql2df(objects_script(self.ra, self.dec, radius, n_max, max_g))
+        index.fetch(self.ra, self.dec, radius)
+        df = index.query(self.ra, self.dec, radius)
+        if max_g is not None:
+            df = df[df['g'] < max_g].reset_index(drop=True)
+        return df.head(n_max)
+
+    def nearest_spects(self, radius=None, n_max=1000, index=None):
         """
         radius : arcmin
+        index : optional sdss.index.SkyIndex('spects'); the search is then
+                answered from it, fetching only the cells it does not cover
         """
+        from .index import spects_script
         if radius is None:
             radius = (self.fov * 60) /2
-        scrip = f"""SELECT TOP {n_max} 
-        sp.objID, f.specObjID, f.distance, sp.ra, sp.dec, sp.class, sp.subClass,
-        sp.modelMag_u AS u, sp.modelMag_g AS g, sp.modelMag_r AS r, sp.modelMag_i AS i, sp.modelMag_z AS z, 
-        f.z AS redshift, f.zErr, f.zWarning
-        FROM dbo.fGetNearbySpecObjEq({self.ra},{self.dec},{radius}) AS f
-        JOIN SpecPhoto AS sp ON sp.specObjID = f.specObjID
-        ORDER BY f.distance"""
-        df = sql2df(scrip)
-        float_cols = ['distance','ra','dec','u','g','r','i','z','redshift','zErr']
-        df[float_cols] = df[float_cols].astype(float)
-        return df
+        if index is None:
+            return sql2df(spects_script(self.ra, self.dec, radius, n_max))
+        index.fetch(self.ra, self.dec, radius)
+        return index.query(self.ra, self.dec, radius).head(n_max)
+
+
+def build_pyramid(img, levels=4, block=1<<24):
+    """
+    List of img downsampled by 2, 4, ... (2x2 block means).
 
+    Each level is computed from the previous one a band of rows at a time
+    (about block source values per band), so a memory-mapped mosaic is
+    never copied whole into memory.
+    """
+    pyramid = []
+    for _ in range(levels):
+        h, w = img.shape[0]//2, img.shape[1]//2
+        if h == 0 or w == 0:
+            break
+        out = np.empty((h, w) + img.shape[2:], dtype=np.uint8)
+        rows = max(1, block // (4 * w * max(int(np.prod(img.shape[2:])), 1)))
+        for r in range(0, h, rows):
+            n = min(rows, h - r)
+            blocks = img[2*r:2*(r+n), :2*w].reshape((n, 2, w, 2) + img.shape[2:])
+            out[r:r+n] = blocks.sum(axis=(1, 3), dtype=np.uint16) // 4
+        img = out
+        pyramid.append(img)
+    return pyramid
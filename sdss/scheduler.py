@@ -0,0 +1,269 @@
+"""
+scheduler module
+----------------
+Pacing of the requests sent by the transport.
+
+Requests are classified by endpoint (sql, cutout, spectrum, sas) and each
+endpoint has:
+
+    - a token bucket limiting the request rate (the SkyServer SQL service
+      allows about 60 queries per minute), paused by Retry-After
+    - an adaptive concurrency limit (AIMD): it grows by one request per
+      round of successful requests and is halved on throttling, server
+      errors and on responses slower than the target latency
+
+Identical requests in flight at the same time (e.g. many threads asking for
+the catalog of one field) are sent once and all callers get the result.
+
+The policies can be changed per transport:
+
+    from sdss.scheduler import Scheduler, POLICIES
+    from sdss.transport import Transport, set_transport
+    policies = {**POLICIES, 'sql':{**POLICIES['sql'], 'rate':None}}
+    set_transport(Transport(scheduler=Scheduler(policies)))
+"""
+
+import threading, time
+from urllib.parse import urlsplit
+from . import metrics
+
+# rate (requests per second, None: unlimited) and burst of the token bucket;
+# initial, minimum and maximum concurrency; target latency in seconds (None:
+# errors only). Streamed downloads hold their slot until the body is read,
+# so their latency is the whole transfer.
+POLICIES = {
+    'sql':{'rate':1.0, 'burst':60, 'concurrency':4, 'min_concurrency':1,
+           'max_concurrency':16, 'latency':30.0},
+    'cutout':{'rate':10.0, 'burst':20, 'concurrency':4, 'min_concurrency':1,
+              'max_concurrency':32, 'latency':10.0},
+    'spectrum':{'rate':10.0, 'burst':20, 'concurrency':4, 'min_concurrency':1,
+                'max_concurrency':32, 'latency':30.0},
+    'sas':{'rate':None, 'burst':None, 'concurrency':8, 'min_concurrency':2,
+           'max_concurrency':32, 'latency':120.0},
+}
+
+
+def endpoint(url):
+    """Endpoint of a SDSS url: 'sql', 'cutout', 'spectrum' or 'sas'"""
+    path = urlsplit(url).path.lower()
+    if path.endswith('/sqlsearch'):
+        return 'sql'
+    if path.endswith('/getjpeg') or path.endswith('specbyid.ashx'):
+        return 'cutout'
+    if '/optical/spectrum/' in path:
+        return 'spectrum'
+    return 'sas'
+
+
+class TokenBucket:
+    """
+    Arguments
+    ---------
+        rate : tokens added per second (None for no limit)
+        burst : maximum number of tokens
+    """
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 1, 1)
+        self.tokens = float(self.burst)
+        self._t = time.monotonic()
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every request for seconds (e.g. after Retry-After)"""
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Wait for a token"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._not_before - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.burst, self.tokens + (now - self._t) * self.rate)
+                    self._t = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adapted with additive increase, multiplicative
+    decrease.
+
+    Arguments
+    ---------
+        limit : initial number of concurrent requests
+        min_limit, max_limit : bounds of the limit
+        latency : target latency in seconds (None: react to errors only)
+        decrease : factor applied to the limit on congestion
+    """
+    def __init__(self, limit=4, min_limit=1, max_limit=32, latency=None, decrease=0.5):
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency = latency
+        self.decrease = decrease
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a slot; returns the start time to pass to release"""
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+        return time.monotonic()
+
+    def release(self, start, error=False):
+        """
+        Free a slot and adapt the limit. Returns True if the limit was
+        decreased.
+        """
+        now = time.monotonic()
+        slow = self.latency is not None and now - start > self.latency
+        decreased = False
+        with self._cond:
+            self.inflight -= 1
+            if error or slow:
+                # requests sent before the last decrease saw the old limit:
+                # cut once per round trip, not once per failed request
+                if start >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+                    decreased = True
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+        return decreased
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run identical concurrent calls once and share the result"""
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Return func(), or the result of the call with the same key already
+        in flight (its exception is raised in every caller).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if metrics.enabled:
+                metrics.record('scheduler', coalesced=1)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class Scheduler:
+    """
+    Arguments
+    ---------
+        policies : dict of endpoint -> policy (see POLICIES)
+    """
+    def __init__(self, policies=None):
+        self.policies = policies if policies is not None else POLICIES
+        self.buckets = {}
+        self.limiters = {}
+        for name, p in self.policies.items():
+            self.buckets[name] = TokenBucket(p['rate'], p['burst'])
+            self.limiters[name] = AIMDLimiter(p['concurrency'], p['min_concurrency'],
+                                              p['max_concurrency'], p['latency'])
+        self.flight = SingleFlight()
+
+    def split(self, n):
+        """
+        New Scheduler for one of n processes sharing the budgets of this
+        one: rates, bursts and concurrency bounds divided by n.
+        """
+        policies = {}
+        for name, p in self.policies.items():
+            p = dict(p)
+            if p['rate'] is not None:
+                p['rate'] = p['rate'] / n
+            if p['burst'] is not None:
+                p['burst'] = max(1, p['burst'] // n)
+            for k in ('concurrency', 'min_concurrency', 'max_concurrency'):
+                p[k] = max(1, p[k] // n)
+            policies[name] = p
+        return Scheduler(policies)
+
+    def __getstate__(self):
+        # a copy starts afresh with the same policies (and budgets: see split)
+        return {'policies':self.policies}
+
+    def __setstate__(self, state):
+        self.__init__(state['policies'])
+
+    def _endpoint(self, url):
+        name = endpoint(url)
+        return name if name in self.limiters else 'sas'
+
+    def acquire(self, url):
+        """
+        Wait until a request to url may be sent.
+        Returns a ticket to pass to release.
+        """
+        name = self._endpoint(url)
+        start = self.limiters[name].acquire()
+        try:
+            self.buckets[name].acquire()
+        except BaseException:
+            self.limiters[name].release(start)
+            raise
+        return name, time.monotonic()
+
+    def release(self, ticket, error=False, retry_after=None):
+        """
+        Report the outcome of a request: error for throttling, server and
+        connection errors; retry_after pauses the endpoint.
+        """
+        name, start = ticket
+        if retry_after:
+            self.buckets[name].pause(retry_after)
+        if self.limiters[name].release(start, error) and metrics.enabled:
+            metrics.record(f'scheduler.{name}', decreases=1)
+
+    def coalesce(self, key, func):
+        """func(), shared with the identical call in flight if there is one"""
+        return self.flight.do(key, func)
+
+    def stats(self):
+        """Current concurrency limit and requests in flight per endpoint"""
+        return {name:{'limit':int(l.limit), 'inflight':l.inflight}
+                for name, l in self.limiters.items()}
@@ -0,0 +1,93 @@
+"""
+sky module
+----------
+Spherical geometry helpers: angular separations and a simple partition of
+the sky into cells of roughly equal size.
+
+Cells are declination bands of height `size` degrees, each cut into as many
+right ascension cells as fit at the band edge closest to the equator. A
+cell is identified by one int64.
+"""
+
+import numpy as np
+
+
+def angsep(ra1, dec1, ra2, dec2):
+    """Angular separation in degrees (haversine; arguments in degrees)"""
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    a = np.sin((dec2-dec1)/2)**2 + np.cos(dec1)*np.cos(dec2)*np.sin((ra2-ra1)/2)**2
+    return np.degrees(2*np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+def _n_bands(size):
+    return int(np.ceil(180 / size))
+
+
+def _n_ra(band, size):
+    # number of ra cells in a band
+    lo = -90 + band*size
+    hi = np.minimum(lo + size, 90)
+    edge = np.where((lo < 0) & (hi > 0), 0, np.minimum(np.abs(lo), np.abs(hi)))
+    return np.maximum(1, np.floor(360*np.cos(np.radians(edge)) / size)).astype(np.int64)
+
+
+def _stride(size):
+    return int(np.ceil(360 / size)) + 1
+
+
+def cell_ids(ra, dec, size):
+    """Cell of each position (arrays in degrees)"""
+    ra = np.asarray(ra, dtype=float) % 360
+    dec = np.asarray(dec, dtype=float)
+    band = np.clip(np.floor((dec + 90) / size), 0, _n_bands(size)-1).astype(np.int64)
+    n = _n_ra(band, size)
+    i = np.minimum(np.floor(ra / 360 * n).astype(np.int64), n-1)
+    return band * _stride(size) + i
+
+
+def cell_bounds(cell, size):
+    """(ra_min, ra_max, dec_min, dec_max) of a cell in degrees"""
+    band, i = divmod(int(cell), _stride(size))
+    n = int(_n_ra(band, size))
+    dec_min = -90 + band*size
+    return 360*i/n, 360*(i+1)/n, dec_min, min(dec_min + size, 90)
+
+
+def cell_circle(cell, size):
+    """(ra, dec, radius) of a circle in degrees containing the cell"""
+    ra_min, ra_max, dec_min, dec_max = cell_bounds(cell, size)
+    ra = (ra_min + ra_max) / 2
+    dec = (dec_min + dec_max) / 2
+    corners_ra = np.array([ra_min, ra_min, ra_max, ra_max])
+    corners_dec = np.array([dec_min, dec_max, dec_min, dec_max])
+    radius = angsep(ra, dec, corners_ra, corners_dec).max()
+    # the edges of a band bulge away from the equator between the corners
+    radius = max(radius, dec - dec_min, dec_max - dec)
+    return ra, dec, radius
+
+
+def cone_cells(ra, dec, radius, size):
+    """Cells that may intersect a cone (degrees); a superset"""
+    n_bands = _n_bands(size)
+    b0 = max(int(np.floor((dec - radius + 90) / size)), 0)
+    b1 = min(int(np.floor((dec + radius + 90) / size)), n_bands-1)
+    stride = _stride(size)
+    max_dec = min(abs(dec) + radius, 90)
+    if max_dec >= 90 - 1e-9:
+        dra = 180
+    else:
+        dra = min(np.degrees(np.arcsin(min(np.sin(np.radians(radius)) /
+                                           np.cos(np.radians(max_dec)), 1))), 180)
+        dra = 180 if dra >= 90 else dra
+    cells = []
+    for band in range(b0, b1+1):
+        n = int(_n_ra(band, size))
+        if dra >= 180:
+            idx = range(n)
+        else:
+            i0 = int(np.floor((ra - dra) % 360 / 360 * n))
+            i1 = int(np.floor((ra + dra) % 360 / 360 * n))
+            count = (i1 - i0) % n + 1
+            idx = [(i0 + k) % n for k in range(count)]
+        cells.extend(band*stride + i for i in idx)
+    return cells
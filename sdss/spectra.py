@@ -0,0 +1,97 @@
+"""
+spectra module
+--------------
+Bulk retrieval of spectra into dense arrays on a common wavelength grid.
+
+    from sdss.spectra import load_spectra
+    sp = load_spectra(spec_ids, out='train_set')   # memory-mapped .npy files
+    sp['flux'].shape  # (len(spec_ids), len(sp['loglam']))
+"""
+
+import io, os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from astropy.io import fits
+from .objects import SpecObj
+from .transport import get_transport
+
+
+def loglam_grid(start=3.5523, stop=4.0171, step=1e-4):
+    """log10(wavelength in Angstrom) grid with the SDSS pixel spacing"""
+    n = int(round((stop - start) / step)) + 1
+    return start + step*np.arange(n)
+
+
+def read_spectrum(content):
+    """(loglam, flux, ivar) of a spectrum FITS file given as bytes"""
+    with fits.open(io.BytesIO(content)) as hdul:
+        coadd = hdul[1].data
+        return (np.array(coadd['loglam'], dtype=float),
+                np.array(coadd['flux'], dtype=float),
+                np.array(coadd['ivar'], dtype=float))
+
+
+def _alloc(out, name, shape, dtype):
+    if out is None or out.endswith('.npz'):
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(out, name + '.npy'),
+                                     mode='w+', dtype=dtype, shape=shape)
+
+
+def load_spectra(specObjIDs, grid=None, out=None, lite=True, max_workers=8,
+                 dtype=np.float32):
+    """
+    Download spectra and resample them onto a common log-lambda grid.
+
+    Arguments
+    ---------
+        specObjIDs : list of specObjIDs
+        grid : increasing log10(wavelength) grid (default loglam_grid())
+        out : None for in-memory arrays, a directory for memory-mapped
+              .npy files (flux, ivar, missing, loglam), or a .npz filename
+        lite : use the lite spectrum files
+        max_workers : number of concurrent downloads
+        dtype : dtype of flux and ivar
+
+    Returns
+    -------
+        dict with 'flux' and 'ivar' (N, len(grid)), 'missing' (N,) bool for
+        spectra that could not be downloaded or read, 'errors' mapping the
+        row of each missing spectrum to the reason, and 'loglam'. ivar is 0
+        outside the wavelength range of a spectrum. errors is not written
+        to out.
+    """
+    grid = loglam_grid() if grid is None else np.asarray(grid, dtype=float)
+    n = len(specObjIDs)
+    if out is not None and not out.endswith('.npz'):
+        os.makedirs(out, exist_ok=True)
+    flux = _alloc(out, 'flux', (n, len(grid)), dtype)
+    ivar = _alloc(out, 'ivar', (n, len(grid)), dtype)
+    missing = _alloc(out, 'missing', (n,), bool)
+    errors = {}
+
+    def load(k):
+        try:
+            url = SpecObj(specObjIDs[k]).spec_url(lite=lite)
+            loglam, f, iv = read_spectrum(get_transport().content(url))
+        except Exception as e:
+            # not found, connection lost after the retries, or a corrupt
+            # file: one bad spectrum must not lose the whole batch
+            missing[k] = True
+            errors[k] = f"{type(e).__name__}: {e}"
+            return
+        flux[k] = np.interp(grid, loglam, f, left=0, right=0)
+        ivar[k] = np.interp(grid, loglam, iv, left=0, right=0)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        list(ex.map(load, range(n)))
+
+    result = {'flux':flux, 'ivar':ivar, 'missing':missing, 'loglam':grid}
+    if out is not None and out.endswith('.npz'):
+        np.savez(out, **result)
+    elif out is not None:
+        for a in (flux, ivar, missing):
+            a.flush()
+        np.save(os.path.join(out, 'loglam.npy'), grid)
+    result['errors'] = dict(sorted(errors.items()))
+    return result
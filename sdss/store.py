@@ -0,0 +1,136 @@
+"""
+store module
+------------
+Local store of decompressed SDSS frames, shared by processes.
+
+Frames are addressed by (run, camcol, field, band, rerun), downloaded once
+and opened memory-mapped, so only the rows that are read are paged in and
+processes reading the same frame share its pages. The store has a disk
+budget; the least recently used frames are removed when it is exceeded.
+
+    from sdss.store import FrameStore
+    store = FrameStore('~/sdss_frames', max_bytes=50*1024**3)
+    cut = store.section(756, 3, 100, 'r', x=1024, y=700, half=32)
+"""
+
+import os, shutil, tempfile, time
+from astropy.io import fits
+from .utils import decode_objid, sql2df
+from .photometry import frame_url, fetch_file, frame_wcs
+
+
+class FrameStore:
+    """
+    Arguments
+    ---------
+        root : store directory
+        max_bytes : disk budget in bytes
+        dr : data release of the frames
+    """
+    def __init__(self, root='~/.cache/sdss/frames', max_bytes=20*1024**3, dr=17):
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self.dr = dr
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, run, camcol, field, band, rerun=301):
+        """Local filename of a frame (it may not exist yet)"""
+        url = frame_url(run, camcol, field, band, rerun=rerun, dr=self.dr)
+        name = url.rsplit('/', 1)[-1][:-4]
+        return os.path.join(self.root, str(rerun), str(run), str(camcol), name)
+
+    def get(self, run, camcol, field, band, rerun=301):
+        """Filename of a frame, downloading it if it is not in the store"""
+        filename = self.path(run, camcol, field, band, rerun=rerun)
+        if os.path.exists(filename):
+            try:
+                # mark as recently used; mtime is kept as it keys the WCS cache
+                os.utime(filename, (time.time(), os.stat(filename).st_mtime))
+            except FileNotFoundError:
+                return self.get(run, camcol, field, band, rerun=rerun)
+            return filename
+        directory = os.path.dirname(filename)
+        os.makedirs(directory, exist_ok=True)
+        # download in a private directory, then move in place atomically
+        tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.fetch-')
+        try:
+            url = frame_url(run, camcol, field, band, rerun=rerun, dr=self.dr)
+            os.replace(fetch_file(url, tmp_dir), filename)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=filename)
+        return filename
+
+    def obj_get(self, objid, band):
+        dc = decode_objid(objid)
+        return self.get(dc['run'], dc['camcol'], dc['field'], band, rerun=dc['rerun'])
+
+    def open(self, run, camcol, field, band, rerun=301):
+        """Memory-mapped HDUList of a frame (close it after use)"""
+        return fits.open(self.get(run, camcol, field, band, rerun=rerun), memmap=True)
+
+    def data(self, run, camcol, field, band, rerun=301):
+        """Memory-mapped image of a frame"""
+        return fits.getdata(self.get(run, camcol, field, band, rerun=rerun), 0, memmap=True)
+
+    def section(self, run, camcol, field, band, x, y, half=50, rerun=301):
+        """
+        Window of the image of a frame around pixel (x, y), clipped at the
+        frame edges. Only the rows of the window are read.
+        """
+        with self.open(run, camcol, field, band, rerun=rerun) as hdul:
+            h, w = hdul[0].shape
+            x, y = int(round(float(x))), int(round(float(y)))
+            y0, y1 = max(y-half, 0), min(y+half, h)
+            x0, x1 = max(x-half, 0), min(x+half, w)
+            return hdul[0].section[y0:y1, x0:x1]
+
+    def obj_section(self, objid, band, half=50, ra=None, dec=None):
+        """
+        Window around a photo object in its frame. The position of the
+        object is queried if ra/dec are not given.
+        """
+        if ra is None or dec is None:
+            df = sql2df(f"SELECT ra, dec FROM PhotoObj WHERE objID={objid}")
+            if len(df) == 0:
+                raise Exception('Photo object not found!')
+            ra, dec = df['ra'].iloc[0], df['dec'].iloc[0]
+        dc = decode_objid(objid)
+        filename = self.get(dc['run'], dc['camcol'], dc['field'], band, rerun=dc['rerun'])
+        x, y = frame_wcs(filename).world_to_pixel_values(ra, dec)
+        return self.section(dc['run'], dc['camcol'], dc['field'], band, x, y,
+                            half=half, rerun=dc['rerun'])
+
+    def _frames(self):
+        frames = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.fetch-')]
+            for name in filenames:
+                if not name.endswith('.fits'):
+                    continue
+                filename = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+                frames.append((st.st_atime, st.st_size, filename))
+        return frames
+
+    def size(self):
+        """Total size of the stored frames in bytes"""
+        return sum(f[1] for f in self._frames())
+
+    def evict(self, keep=None):
+        """Remove least recently used frames until the store fits max_bytes"""
+        frames = sorted(self._frames())
+        total = sum(f[1] for f in frames)
+        for _, size, filename in frames:
+            if total <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total -= size
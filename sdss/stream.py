@@ -0,0 +1,163 @@
+"""
+stream module
+-------------
+Queries returning more rows than SkyServer allows in one response.
+
+sql_chunks pages through a table ordered by a unique key (objID, specObjID,
+htmID...) with "WHERE key > last ORDER BY key" queries. sql_stripes splits
+a range of any column (e.g. ra) into stripes, halving the stripes that hit
+the row limit. Both are generators of DataFrames, so results never have to
+fit in memory; sql_to_parquet writes the chunks to disk and can resume an
+interrupted extract.
+
+Example:
+
+    from sdss.stream import sql_to_parquet
+    sql_to_parquet('extract', 'objID, ra, dec, u, g, r, i, z', 'PhotoObj',
+                   key='objID', where='run=756 AND camcol BETWEEN 1 AND 3')
+"""
+
+import json, os
+from .utils import sql2df, require_parquet
+
+
+def _where(conds):
+    conds = [c for c in conds if c]
+    return ' WHERE ' + ' AND '.join(conds) if conds else ''
+
+
+def _column(df, key):
+    # result columns lose the table alias and may differ in case
+    name = key.split('.')[-1].lower()
+    for c in df.columns:
+        if c.lower() == name:
+            return c
+    raise Exception(f"Key column '{key}' is not in the result.")
+
+
+def sql_chunks(columns, table, key='objID', where='', start=None, stop=None,
+               after=None, chunk_size=50000, dtype=None, dr=16):
+    """
+    Yield the result of a query as DataFrames of at most chunk_size rows.
+
+    Arguments
+    ---------
+        columns : columns to select (the key must be one of them)
+        table : table name (may contain joins)
+        key : unique column to page on
+        where : additional condition
+        start, stop : key range [start, stop)
+        after : resume after this key value (exclusive)
+        chunk_size : rows per query; must not exceed the SkyServer limit
+    """
+    last = after
+    while True:
+        conds = [f"{key}>={start}" if start is not None and last is None else '',
+                 f"{key}>{last}" if last is not None else '',
+                 f"{key}<{stop}" if stop is not None else '',
+                 f"({where})" if where else '']
+        script = f"SELECT TOP {chunk_size} {columns} FROM {table}" + \
+                 _where(conds) + f" ORDER BY {key}"
+        df = sql2df(script, dtype=dtype, dr=dr)
+        if len(df) == 0:
+            return
+        yield df
+        if len(df) < chunk_size:
+            return
+        last = df[_column(df, key)].iloc[-1]
+
+
+def stripe_edges(start, stop, n):
+    """n+1 equally spaced edges between start and stop"""
+    return [start + (stop-start)*k/n for k in range(n+1)]
+
+
+def sql_stripes(columns, table, key, edges, where='', max_rows=50000,
+                min_width=1e-6, dtype=None, dr=16):
+    """
+    Yield the result of a query stripe by stripe of key, e.g. ra stripes.
+
+    Arguments
+    ---------
+        columns : columns to select
+        table : table name (may contain joins)
+        key : column the stripes are taken on
+        edges : increasing stripe edges; stripe k is edges[k] <= key < edges[k+1]
+        where : additional condition
+        max_rows : row limit per query; stripes reaching it are halved
+        min_width : stripes are not split below this width
+    """
+    # python floats: the repr of numpy scalars is not SQL
+    edges = [float(e) for e in edges]
+    stack = [(edges[k], edges[k+1]) for k in range(len(edges)-1)][::-1]
+    while stack:
+        lo, hi = stack.pop()
+        conds = [f"{key}>={lo!r}", f"{key}<{hi!r}", f"({where})" if where else '']
+        script = f"SELECT TOP {max_rows} {columns} FROM {table}" + _where(conds)
+        df = sql2df(script, dtype=dtype, dr=dr)
+        if len(df) >= max_rows:
+            if hi - lo > min_width:
+                mid = (lo + hi) / 2
+                stack.append((mid, hi))
+                stack.append((lo, mid))
+                continue
+            raise Exception(f"Stripe [{lo}, {hi}) exceeds {max_rows} rows.")
+        yield (lo, hi), df
+
+
+def sql_to_parquet(directory, columns, table, key='objID', where='',
+                   start=None, stop=None, edges=None, chunk_size=50000,
+                   dtype=None, dr=16):
+    """
+    Write the result of a query to directory as part-NNNNN.parquet files.
+
+    Pages on a unique key (sql_chunks), or on stripes of key if edges is
+    given (sql_stripes). Progress is saved in directory/checkpoint.json
+    after each part, so calling again with the same arguments resumes
+    after the last completed part.
+
+    Returns the list of part files.
+    """
+    require_parquet()
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = os.path.join(directory, 'checkpoint.json')
+    state = {'parts':[], 'last':None, 'done':False}
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+    if state['done']:
+        return state['parts']
+
+    def save():
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, checkpoint)
+
+    def write(df):
+        filename = os.path.join(directory, f"part-{len(state['parts']):05d}.parquet")
+        df.to_parquet(filename, index=False)
+        state['parts'].append(filename)
+
+    if edges is None:
+        for df in sql_chunks(columns, table, key=key, where=where, start=start,
+                             stop=stop, after=state['last'], chunk_size=chunk_size,
+                             dtype=dtype, dr=dr):
+            write(df)
+            last = df[_column(df, key)].iloc[-1]
+            state['last'] = last.item() if hasattr(last, 'item') else last
+            save()
+    else:
+        edges = [float(e) for e in edges]
+        if state['last'] is not None:
+            # continue from the end of the last completed stripe
+            edges = [state['last']] + [e for e in edges if e > state['last']]
+        for (lo, hi), df in sql_stripes(columns, table, key, edges, where=where,
+                                        max_rows=chunk_size, dtype=dtype, dr=dr):
+            if len(df) > 0:
+                write(df)
+            state['last'] = hi
+            save()
+    state['done'] = True
+    save()
+    return state['parts']
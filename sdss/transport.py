@@ -0,0 +1,248 @@
+"""
+transport module
+----------------
+HTTP layer used by every network call of the package.
+
+A single Transport keeps a pooled keep-alive session, applies timeouts and
+retries throttled (429) or failed (5xx) requests with exponential backoff,
+honoring the Retry-After header of the server. Requests are paced by a
+Scheduler (see sdss.scheduler): rate and adaptive concurrency limits per
+endpoint, and identical concurrent requests sent once.
+
+The default transport can be replaced, e.g. to point the package at a local
+mock server:
+
+    from sdss.transport import Transport, set_transport
+    set_transport(Transport(hosts={'skyserver.sdss.org': 'http://127.0.0.1:8000'}))
+"""
+
+import copy, email.utils, random, sys, time, threading, weakref
+from urllib.parse import urlsplit
+from . import metrics
+from .scheduler import Scheduler
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class Transport:
+    """
+    Arguments
+    ---------
+        timeout : seconds (or (connect, read) tuple) for each request
+        retries : number of retries after the first attempt
+        backoff : base delay of the exponential backoff in seconds
+        max_backoff : upper limit for a single delay in seconds
+        pool_connections : number of hosts to keep connection pools for
+        pool_maxsize : maximum number of connections per host
+        hosts : dict mapping SDSS host names to replacement base URLs
+        headers : extra headers sent with every request
+        scheduler : Scheduler pacing the requests (default: Scheduler());
+                    False to send requests as they come
+    """
+    def __init__(self, timeout=(10, 300), retries=5, backoff=0.5, max_backoff=60,
+                 pool_connections=10, pool_maxsize=10, hosts=None, headers=None,
+                 scheduler=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.hosts = hosts if hosts is not None else {}
+        self.headers = headers if headers is not None else {}
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # settings only: connections and locks are not shared between processes
+        state = self.__dict__.copy()
+        state['_session'] = None
+        del state['_lock']
+        state['scheduler'] = copy.copy(self.scheduler)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                          pool_maxsize=self.pool_maxsize,
+                                          pool_block=True)
+                    s.mount('http://', adapter)
+                    s.mount('https://', adapter)
+                    s.headers.update(self.headers)
+                    self._session = s
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def url(self, url):
+        """Apply the host mapping to url"""
+        if not self.hosts:
+            return url
+        parts = urlsplit(url)
+        base = self.hosts.get(parts.netloc)
+        if base is None:
+            return url
+        return base.rstrip('/') + url[len(parts.scheme)+3+len(parts.netloc):]
+
+    def _delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None:
+                try:
+                    return min(float(retry_after), self.max_backoff)
+                except ValueError:
+                    try:
+                        when = email.utils.parsedate_to_datetime(retry_after)
+                        return min(max(when.timestamp() - time.time(), 0), self.max_backoff)
+                    except (TypeError, ValueError):
+                        pass
+        delay = self.backoff * 2**attempt
+        return min(delay * (0.5 + random.random()/2), self.max_backoff)
+
+    def request(self, method, url, stream=False, **kwargs):
+        """
+        Send a request, retrying throttled/failed attempts.
+        Raises requests.HTTPError if the final response is an error.
+        """
+        import requests
+        scheduler = self.scheduler
+        url = self.url(url)
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            ticket = scheduler.acquire(url) if scheduler else None
+            try:
+                r = self.session.request(method, url, stream=stream, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if ticket is not None:
+                    scheduler.release(ticket, error=True)
+                if attempt >= self.retries:
+                    raise
+                if metrics.enabled:
+                    metrics.record('http', retries=1, errors=1)
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                if ticket is not None:
+                    scheduler.release(ticket)
+                raise
+            if r.status_code in RETRY_STATUS:
+                delay = self._delay(attempt, r)
+                if ticket is not None:
+                    throttled = r.status_code in (429, 503)
+                    scheduler.release(ticket, error=True,
+                                      retry_after=delay if throttled else None)
+                if attempt < self.retries:
+                    r.close()
+                    if metrics.enabled:
+                        metrics.record('http', retries=1, **{f'status_{r.status_code}':1})
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+            elif ticket is not None:
+                if stream and r.status_code < 400:
+                    # the transfer of the body counts: keep the slot until close
+                    _release_on_close(r, scheduler, ticket)
+                else:
+                    scheduler.release(ticket)
+            r.raise_for_status()
+            return r
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def coalesce(self, key, func):
+        """func(), shared with the identical call in flight if there is one"""
+        if not self.scheduler:
+            return func()
+        return self.scheduler.coalesce(key, func)
+
+    def _content(self, url, **kwargs):
+        if not metrics.enabled:
+            return self.get(url, **kwargs).content
+        t = time.perf_counter()
+        content = self.get(url, **kwargs).content
+        metrics.record('http', time.perf_counter() - t, bytes=len(content))
+        return content
+
+    def content(self, url, **kwargs):
+        """Return the body of url as bytes"""
+        if kwargs:
+            return self._content(url, **kwargs)
+        return self.coalesce(('GET', url), lambda: self._content(url))
+
+    def _download(self, url, filename, chunk_size):
+        with self.get(url, stream=True) as r:
+            with open(filename, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+
+    def download(self, url, filename, chunk_size=1<<20):
+        """Stream url into filename"""
+        self.coalesce(('download', url, filename),
+                      lambda: self._download(url, filename, chunk_size))
+
+
+def _release_on_close(r, scheduler, ticket):
+    """
+    Release the scheduler ticket of a streamed response when it is closed
+    (or garbage collected); the release is an error if the body transfer
+    failed.
+    """
+    import requests
+    lock = threading.Lock()
+    released = []
+
+    def release(error=False):
+        with lock:
+            if released:
+                return
+            released.append(True)
+        scheduler.release(ticket, error=error)
+
+    close = r.close
+
+    def closing():
+        exc = sys.exc_info()[1]
+        try:
+            close()
+        finally:
+            release(isinstance(exc, requests.RequestException))
+
+    r.close = closing
+    weakref.finalize(r, release)
+
+
+_transport = None
+
+
+def get_transport():
+    """Return the transport used by the package"""
+    global _transport
+    if _transport is None:
+        _transport = Transport()
+    return _transport
+
+
+def set_transport(transport):
+    """Replace the transport used by the package"""
+    global _transport
+    old = _transport
+    _transport = transport
+    if old is not None and old is not transport:
+        old.close()
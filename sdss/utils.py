@@ -1,10 +1,8 @@
-from urllib.request import urlopen, urlretrieve
-import requests
-import matplotlib.pyplot as plt
-import pandas as pd
-import binascii, io, bz2, os
-from PIL import Image
+import binascii, io
 import numpy as np
+from .transport import get_transport
+from .cache import get_cache
+from . import metrics
 
 def hmsdms_to_deg(hmsdms):
     """
@@ -29,71 +27,275 @@ def hmsdms_to_deg(hmsdms):
 
     return ra, dec
 
+# (name, lowest bit, number of bits) of the fields packed into the IDs
+_OBJID_LAYOUT = [('version', 59, 4),
+                 ('rerun', 48, 11),
+                 ('run', 32, 16),
+                 ('camcol', 29, 3),
+                 ('first_field', 28, 1),
+                 ('field', 16, 12),
+                 ('id_within_field', 0, 16)]
+
+_SPECID_LAYOUT = [('plate', 50, 14),
+                  ('fiber_id', 38, 12),
+                  ('mjd', 24, 14),
+                  ('run2d', 10, 14)]
+
+_MJD_OFFSET = 50000
+
+
+def _as_uint64(ids):
+    """
+    Convert a scalar, list, numpy array or pandas Series of IDs to a uint64
+    array. Signed int64 IDs (as stored by some databases) are reinterpreted.
+    """
+    if hasattr(ids, 'to_numpy'):
+        ids = ids.to_numpy()
+    arr = np.asarray(ids) if isinstance(ids, np.ndarray) else None
+    if arr is not None and arr.dtype.kind == 'u':
+        return arr.astype(np.uint64, copy=False)
+    if arr is not None and arr.dtype.kind == 'i':
+        return arr.astype(np.int64, copy=False).view(np.uint64)
+    if arr is not None and arr.dtype.kind in 'US':
+        return arr.astype(np.uint64)
+    if np.isscalar(ids):
+        ids = [ids]
+    # python ints may not fit in int64, so never let numpy guess the dtype
+    mask = (1 << 64) - 1
+    return np.fromiter((int(i) & mask for i in ids), dtype=np.uint64)
+
+
+def _decode(ids, layout):
+    ids = _as_uint64(ids)
+    dtype = [(name, np.int64) for name, _, _ in layout]
+    out = np.empty(ids.shape, dtype=dtype)
+    for name, shift, bits in layout:
+        out[name] = (ids >> np.uint64(shift)) & np.uint64((1 << bits) - 1)
+    return out
+
+
+def _encode(values, layout):
+    ids = None
+    for name, shift, bits in layout:
+        v = np.asarray(values[name]).astype(np.uint64)
+        v = (v & np.uint64((1 << bits) - 1)) << np.uint64(shift)
+        ids = v if ids is None else ids | v
+    return ids
+
+
+def decode_objids(obj_ids, as_frame=False):
+    """
+    Decode many objIDs at once using bit shifts.
+
+    Arguments
+    ---------
+        obj_ids : list, numpy array or pandas Series of objIDs (int or str)
+        as_frame : if True return a pandas DataFrame
+
+    Returns
+    -------
+        numpy structured array (or DataFrame) with columns version, rerun,
+        run, camcol, first_field, field, id_within_field
+    """
+    out = _decode(obj_ids, _OBJID_LAYOUT)
+    if as_frame:
+        import pandas as pd
+        return pd.DataFrame(out)
+    return out
+
+
+def decode_specids(spec_ids, as_frame=False):
+    """
+    Decode many specObjIDs at once using bit shifts.
+
+    Arguments
+    ---------
+        spec_ids : list, numpy array or pandas Series of specObjIDs (int or str)
+        as_frame : if True return a pandas DataFrame
+
+    Returns
+    -------
+        numpy structured array (or DataFrame) with columns plate, fiber_id,
+        mjd, run2d
+    """
+    out = _decode(spec_ids, _SPECID_LAYOUT)
+    out['mjd'] += _MJD_OFFSET
+    if as_frame:
+        import pandas as pd
+        return pd.DataFrame(out)
+    return out
+
+
+# run2d codes of the SDSS-I/II reductions; the others encode vN_M_P
+_LEGACY_RUN2D = (26, 103, 104)
+
+
+def run2d_name(run2d):
+    """
+    Name of the spectroscopic reduction encoded in a specObjID: '26', '103'
+    or '104' for SDSS-I/II, 'vN_M_P' for BOSS/eBOSS ((N-5)*10000 + M*100 + P)
+    """
+    run2d = int(run2d)
+    if run2d in _LEGACY_RUN2D:
+        return str(run2d)
+    return f"v{run2d // 10000 + 5}_{run2d // 100 % 100}_{run2d % 100}"
+
+
+def encode_objids(run, camcol, field, id_within_field,
+                  rerun=301, version=2, first_field=0):
+    """
+    Build objIDs from their components (scalars or arrays).
+    Returns a uint64 numpy array (of one ID for scalar arguments).
+    """
+    values = {'version':version, 'rerun':rerun, 'run':run, 'camcol':camcol,
+              'first_field':first_field, 'field':field,
+              'id_within_field':id_within_field}
+    return np.atleast_1d(_encode(values, _OBJID_LAYOUT))
+
+
+def encode_specids(plate, fiber_id, mjd, run2d):
+    """
+    Build specObjIDs from their components (scalars or arrays).
+    Returns a uint64 numpy array (of one ID for scalar arguments).
+    """
+    values = {'plate':plate, 'fiber_id':fiber_id,
+              'mjd':np.asarray(mjd) - _MJD_OFFSET, 'run2d':run2d}
+    return np.atleast_1d(_encode(values, _SPECID_LAYOUT))
+
+
+def _decode_one(obj_id, layout):
+    obj_id = int(obj_id) & ((1 << 64) - 1)
+    return {name: (obj_id >> shift) & ((1 << bits) - 1)
+            for name, shift, bits in layout}
+
+
 def decode_objid(obj_id):
-    if isinstance(obj_id, str):
-        obj_id = int(obj_id)
-    b = bin(obj_id)[2:].zfill(64)
-    dc = {}
-    dc['version'] = int(b[1:5], 2)
-    dc['rerun'] = int(b[5:16], 2)
-    dc['run'] = int(b[16:32], 2)
-    dc['camcol'] = int(b[32:35], 2)
-    dc['first_field'] = int(b[35], 2)
-    dc['field'] = int(b[36:48], 2)
-    dc['id_within_field'] = int(b[48:], 2)
-    return dc
+    return _decode_one(obj_id, _OBJID_LAYOUT)
+
 
 def decode_specid(spec_id):
-    if isinstance(spec_id, str):
-        spec_id = int(spec_id)
-    b = bin(spec_id)[2:].zfill(64)
-    dc = {}
-    dc['plate'] = int(b[:14], 2)
-    dc['fiber_id'] = int(b[14:26], 2)
-    dc['mjd'] = int(b[26:40], 2) + 50000
-    dc['run2d'] = int(b[40:54], 2)
+    dc = _decode_one(spec_id, _SPECID_LAYOUT)
+    dc['mjd'] += _MJD_OFFSET
     return dc
 
-def sql2df(script):
-    BASE = "https://skyserver.sdss.org/dr16/SkyServerWS/SearchTools/SqlSearch?cmd="
-    script = ' '.join(script.strip().split('\n'))
-    url = BASE+script.replace(' ', '%20') + '&format=csv'
-    req = requests.request('GET', url)
-    r = req.content.decode('utf-8')
-    lines = r.splitlines()
-    col = lines[1].split(',')
-    data_lines = [i.split(',') for i in lines[2:]]
-    return pd.DataFrame(data_lines, columns=col)
+def _fetch(name, url):
+    """
+    Body of url. Its size is recorded under name only by the caller that
+    downloads it, not by the callers sharing the same request.
+    """
+    transport = get_transport()
+
+    def fetch():
+        content = transport.content(url)
+        if metrics.enabled:
+            metrics.record(name, bytes=len(content))
+        return content
+
+    return transport.coalesce((name, url), fetch)
+
+
+def require_parquet():
+    """Raise a clear error if pyarrow, needed to write Parquet files, is missing"""
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception("Writing Parquet files needs pyarrow: pip install sdss[parquet]") from None
+
+
+def _sql_url(script, dr=16):
+    BASE = f"https://skyserver.sdss.org/dr{dr}/SkyServerWS/SearchTools/SqlSearch?cmd="
+    script_line = ' '.join(script.strip().split('\n'))
+    return BASE+script_line.replace(' ', '%20') + '&format=csv'
+
+
+@metrics.timed('sql2df')
+def sql2df(script, dtype=None, dr=16):
+    """
+    Run an SQL query on SkyServer and return the result as a DataFrame.
+
+    Arguments
+    ---------
+        script : SQL query
+        dtype : optional dict mapping column names to dtypes; the other
+                columns get their dtypes inferred (64-bit IDs stay integers)
+        dr : data release
+
+    If a cache is enabled (see sdss.cache.enable_cache) results are read
+    from and stored in it with their inferred dtypes; dtype is applied to
+    the result afterwards, so one entry serves every dtype.
+    """
+    import pandas as pd
+    cache = get_cache()
+    if cache is not None:
+        df = cache.get(script, dr)
+        if df is not None:
+            if metrics.enabled:
+                metrics.record('sql2df', rows=len(df), cache_hits=1)
+            return _astype(df, dtype)
+    content = _fetch('sql2df', _sql_url(script, dr))
+    # first line is the table name (#Table1)
+    if cache is None:
+        df = pd.read_csv(io.BytesIO(content), skiprows=1, dtype=dtype)
+    else:
+        df = pd.read_csv(io.BytesIO(content), skiprows=1)
+        cache.put(script, dr, df)
+        df = _astype(df, dtype)
+    if metrics.enabled:
+        metrics.record('sql2df', rows=len(df), cache_misses=int(cache is not None))
+    return df
+
+def _astype(df, dtype):
+    # like the dtype argument of read_csv: names that are not columns are ignored
+    if dtype is None:
+        return df
+    if not isinstance(dtype, dict):
+        return df.astype(dtype)
+    dtype = {k:v for k, v in dtype.items() if k in df.columns}
+    return df.astype(dtype) if dtype else df
 
 def sql_columns(table_name):
     script = f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME='{table_name}'"
     df = sql2df(script)
     return list(df['COLUMN_NAME'])
 
+@metrics.timed('binimg2array')
 def binimg2array(img_raw):
-    img_raw = img_raw[2:]
-    img_b = binascii.a2b_hex(img_raw)
+    """
+    Decode a hex encoded image ('0x...' as str or bytes) to an array.
+    Bytes-like input is decoded through a memoryview, without copies.
+    """
+    from PIL import Image
+    if isinstance(img_raw, str):
+        img_b = binascii.a2b_hex(img_raw[2:])
+    else:
+        view = memoryview(img_raw)
+        img_b = binascii.a2b_hex(view[2:])
     img = Image.open(io.BytesIO(img_b))
     data = np.array(img)
     return data
 
+@metrics.timed('img_cutout')
 def img_cutout(ra, dec, scale, width, height, opt, query):
+    from PIL import Image
     BASE = "https://skyserver.sdss.org/dr16/SkyServerWS/ImgCutout/getjpeg?"
     PAR = f"ra={ra}&dec={dec}&scale={scale}&width={width}&height={height}"
     OPT = "&opt="+opt if opt !='' else ''
     QRY = "&query="+query if query!='' else ''
     url = BASE + PAR + OPT + QRY
-    data = plt.imread(urlopen(url), format='jpeg')
+    content = _fetch('img_cutout', url)
+    data = np.array(Image.open(io.BytesIO(content)))
     return data
 
 def show_spect(specObjID, figsize=(15,20)):
+    import matplotlib.pyplot as plt
     url = f"http://skyserver.sdss.org/dr16/en/get/SpecById.ashx?id={specObjID}"
-    data = plt.imread(urlopen(url), format='jpeg')
+    data = plt.imread(io.BytesIO(get_transport().content(url)), format='jpeg')
     fig, ax = plt.subplots(figsize=figsize)
     ax.imshow(data)
     plt.show()
 
 def show_object(objID, scale=0.1, width=300, height=300, figsize=(10,10)):
+    import matplotlib.pyplot as plt
     script = f"SELECT TOP 1 ra,dec FROM PhotoObj WHERE objID={objID}"
     df = sql2df(script)
     ra, dec = df['ra'].iloc[0], df['dec'].iloc[0]
@@ -104,6 +306,7 @@ def show_object(objID, scale=0.1, width=300, height=300, figsize=(10,10)):
 
 def download_frame(field, run, camcol, band, fr_type='jpg', path=''):
     """EXPIRED! Use sdss.photometry!"""
+    from .photometry import fetch_file
     rerun = 301 #currently fixed
     zrun = str(run).zfill(6)
     zfield = str(field).zfill(4)
@@ -117,11 +320,4 @@ def download_frame(field, run, camcol, band, fr_type='jpg', path=''):
     
     BASE = "https://data.sdss.org/sas/dr16/eboss/photoObj/frames/"
     url = BASE + f"{rerun}/{run}/{camcol}/" + filename
-    urlretrieve(url, path+filename)
-    
-    if fr_type=='fits':
-        with bz2.open(path+filename, 'rb') as f:
-            content = f.read()
-        with open(path+filename[:-4], 'wb') as f:
-            f.write(content)
-        os.remove(path+filename)
+    fetch_file(url, path)
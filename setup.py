@@ -20,6 +20,8 @@ setuptools.setup(
     ],
     packages=["sdss"],
     include_package_data=True,
+    entry_points={'console_scripts': ['sdss=sdss.cli:main']},
     install_requires=["numpy", "requests", "Pillow", "matplotlib", "pandas", "astropy"],
+    extras_require={'parquet': ['pyarrow']},
     python_requires='>=3.8',
 )